@@ -0,0 +1,281 @@
+"""
+Batch runner of headless games for balancing.
+Plays seeded games with a scripted policy for every combination of balance values, spreads them over
+a process pool and streams per-game results to a columnar file:
+
+    python batch.py --games 1000 --min-speed 2,4 --k-hitbox 0.8,0.85 --out sweep.cols
+    python batch.py --games 1000 --policy random --out sweep.parquet
+
+Pixel masks ignore hitbox size, so games of --k-hitbox sweeps collide by hitboxes.
+
+Every parameter set plays the same seeds, so differences between sets are not hidden by spawn luck.
+Workers never open a display, sprites are loaded as plain surfaces.
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import itertools
+import json
+import random
+import struct
+import sys
+from multiprocessing import Pool
+from time import perf_counter
+import numpy as np
+from game_config import *
+
+PARAMS = ("min_speed", "max_speed", "delta_speed", "k_hitbox", "invulnerable_time", "pixel_collision")
+COLUMNS = (
+    ("min_speed", np.int32), ("max_speed", np.int32), ("delta_speed", np.int32), ("k_hitbox", np.float64),
+    ("invulnerable_time", np.int32), ("pixel_collision", np.int8),
+    ("seed", np.int64), ("frames", np.int32), ("survival_time", np.float64),
+    ("score", np.float64), ("collisions", np.int32), ("coins", np.int32), ("health", np.int32),
+)
+
+COLUMNS_MAGIC = b"CRCOLS1\n"
+_ROWS = struct.Struct("<I")
+
+
+def idle_policy(seed: int):
+    """
+    :param seed: seed of game
+    :return: policy which never touches the keys
+    """
+    from game_items import Keys
+
+    return lambda simulation: Keys.NONE
+
+
+def random_policy(seed: int):
+    """
+    :param seed: seed of game
+    :return: policy which presses random single key, same seed gives the same keys
+    """
+    from game_items import Keys
+
+    rng = random.Random(seed)
+    keys = [Keys.NONE, Keys.LEFT, Keys.RIGHT, Keys.UP, Keys.DOWN]
+    return lambda simulation: rng.choice(keys)
+
+
+def dodge_policy(seed: int, lookahead: int = DP_HEIGHT // 3):
+    """
+    :param seed: seed of game
+    :param lookahead: distance above user car where enemies are avoided
+    :return: policy which steers away from enemies in front of user car
+    """
+    from game_items import Keys
+
+    left_edge = DP_HEIGHT / 5 + DP_DELTA
+    right_edge = DP_HEIGHT - DP_HEIGHT / 5 + DP_DELTA
+
+    def policy(simulation):
+        car = simulation.user_car.rect
+        store = simulation.enemies.store
+        slots = store.active()
+        if not len(slots):
+            return Keys.NONE
+        x, y = store.x[slots], store.y[slots]
+        right, bottom = x + store.w[slots], y + store.h[slots]
+        ahead = (bottom > car.top - lookahead) & (y < car.bottom) & (x < car.right) & (right > car.left)
+        if not ahead.any():
+            return Keys.NONE
+        threat = (x[ahead] + right[ahead]).mean() / 2
+        if car.left - car.width < left_edge:
+            return Keys.RIGHT
+        if car.right + car.width > right_edge:
+            return Keys.LEFT
+        return Keys.LEFT if threat >= car.centerx else Keys.RIGHT
+
+    return policy
+
+
+POLICIES = {"idle": idle_policy, "random": random_policy, "dodge": dodge_policy}
+
+
+def play_games(task: tuple):
+    """
+    Worker function, plays a chunk of games with one parameter set.
+    :param task: tuple of parameter dict, policy name, list of seeds and max frames of one game
+    :return: dict of result columns
+    """
+    from game_engine import Simulation
+
+    params, policy_name, seeds, max_frames = task
+    simulation = Simulation(seed=seeds[0], **params)
+    rows = []
+    for seed in seeds:
+        simulation.reset(seed)
+        simulation.run(POLICIES[policy_name](seed), max_frames)
+        rows.append((*(params[name] for name in PARAMS), seed, simulation.frame_count, simulation.time,
+                     simulation.score, simulation.collisions, simulation.coins.count, simulation.user_car.health))
+    return {name: np.array([row[i] for row in rows], dtype) for i, (name, dtype) in enumerate(COLUMNS)}
+
+
+class ColumnWriter:
+    def __init__(self, file_path: str, meta: dict = None):
+        """
+        Writes result chunks as row groups, every column of a group is stored as one contiguous array.
+        Files ending with .parquet are written with pyarrow, others in the own format read by load_columns.
+        :param file_path: path to output file
+        :param meta: description of the run stored in the file
+        """
+        self.file_path = file_path
+        self.rows = 0
+        self._parquet = None
+        self._file = None
+        if file_path.endswith(".parquet"):
+            import pyarrow
+            import pyarrow.parquet
+
+            schema = pyarrow.schema([(name, pyarrow.from_numpy_dtype(dtype)) for name, dtype in COLUMNS],
+                                    metadata={"meta": json.dumps(meta or {})})
+            self._parquet = pyarrow.parquet.ParquetWriter(file_path, schema)
+        else:
+            header = json.dumps({"columns": [(name, np.dtype(dtype).str) for name, dtype in COLUMNS],
+                                 "meta": meta or {}}).encode()
+            self._file = open(file_path, "wb")
+            self._file.write(COLUMNS_MAGIC + _ROWS.pack(len(header)) + header)
+
+    def write(self, columns: dict):
+        """
+        Appends row group.
+        :param columns: dict of equally long column arrays
+        """
+        rows = len(columns[COLUMNS[0][0]])
+        if self._parquet is not None:
+            import pyarrow
+
+            self._parquet.write_table(pyarrow.table({name: columns[name] for name, _ in COLUMNS}))
+        else:
+            self._file.write(_ROWS.pack(rows))
+            for name, dtype in COLUMNS:
+                self._file.write(np.ascontiguousarray(columns[name], dtype).tobytes())
+            self._file.flush()
+        self.rows += rows
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        else:
+            self._file.close()
+
+
+def load_columns(file_path: str):
+    """
+    Reads file written by ColumnWriter in the own format.
+    :param file_path: path to results
+    :return: tuple of dict of column arrays and dict of run description
+    """
+    with open(file_path, "rb") as file:
+        data = file.read()
+    if not data.startswith(COLUMNS_MAGIC):
+        raise ValueError(f"{file_path}: not a batch result file")
+    offset = len(COLUMNS_MAGIC)
+    (size,) = _ROWS.unpack_from(data, offset)
+    offset += _ROWS.size
+    header = json.loads(data[offset:offset + size])
+    offset += size
+    dtypes = [(name, np.dtype(dtype)) for name, dtype in header["columns"]]
+
+    chunks = {name: [] for name, _ in dtypes}
+    # last group of file which is still written may be incomplete, it is skipped
+    while offset + _ROWS.size <= len(data):
+        (rows,) = _ROWS.unpack_from(data, offset)
+        end = offset + _ROWS.size + rows * sum(dtype.itemsize for _, dtype in dtypes)
+        if end > len(data):
+            break
+        offset += _ROWS.size
+        for name, dtype in dtypes:
+            chunks[name].append(np.frombuffer(data, dtype, rows, offset))
+            offset += rows * dtype.itemsize
+    columns = {name: np.concatenate(parts) if parts else np.zeros(0, dtype)
+               for (name, dtype), parts in zip(dtypes, chunks.values())}
+    return columns, header["meta"]
+
+
+def parameter_grid(values: dict):
+    """
+    :param values: dict of parameter name and list of its values
+    :return: list of parameter dicts, one for every combination
+    """
+    return [dict(zip(PARAMS, combination)) for combination in itertools.product(*(values[name] for name in PARAMS))]
+
+
+def make_tasks(grid: list, policy: str, games: int, first_seed: int, chunk: int, max_frames: int):
+    """
+    :return: list of worker tasks, every parameter set plays seeds first_seed .. first_seed + games - 1
+    """
+    seeds = list(range(first_seed, first_seed + games))
+    return [(params, policy, seeds[i:i + chunk], max_frames) for params in grid for i in range(0, games, chunk)]
+
+
+def _values(kind):
+    return lambda text: [kind(value) for value in text.split(",")]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="headless balancing sweeps")
+    parser.add_argument("--games", help="number of games for every parameter set", type=int, default=100)
+    parser.add_argument("--seed", help="seed of the first game", type=int, default=0)
+    parser.add_argument("--policy", help="scripted user car control", choices=sorted(POLICIES), default="dodge")
+    parser.add_argument("--max-time", help="max game time in seconds", type=float, default=600)
+    parser.add_argument("--workers", help="number of worker processes", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk", help="games in one worker task", type=int, default=25)
+    parser.add_argument("--out", help="columnar output file, .parquet needs pyarrow", type=str,
+                        default="batch.cols")
+    parser.add_argument("--min-speed", help="comma separated values", type=_values(int), default=[MIN_BG_SPEED])
+    parser.add_argument("--max-speed", help="comma separated values", type=_values(int), default=[MAX_BG_SPEED])
+    parser.add_argument("--delta-speed", help="comma separated values", type=_values(int),
+                        default=[DELTA_BG_SPEED])
+    parser.add_argument("--k-hitbox", help="comma separated values, games collide by hitboxes",
+                        type=_values(float))
+    parser.add_argument("--invulnerable-time", help="comma separated values", type=_values(int),
+                        default=[USER_CAR_INVULNERABLE_TIME])
+    parser.add_argument("--collision", help="narrow phase of collisions, hitbox by default with --k-hitbox",
+                        choices=["pixel", "hitbox"])
+    args = parser.parse_args()
+
+    if args.collision is None:
+        args.collision = "hitbox" if args.k_hitbox or not PIXEL_COLLISION else "pixel"
+    if args.collision == "pixel" and args.k_hitbox:
+        parser.error("pixel collisions do not use hitboxes, --k-hitbox needs --collision hitbox")
+    args.k_hitbox = args.k_hitbox or [K_HITBOX]
+    args.pixel_collision = [args.collision == "pixel"]
+
+    grid = parameter_grid({name: getattr(args, name) for name in PARAMS})
+    max_frames = int(args.max_time * FPS)
+    tasks = make_tasks(grid, args.policy, args.games, args.seed, args.chunk, max_frames)
+    meta = {"policy": args.policy, "games": args.games, "seed": args.seed, "max_frames": max_frames, "fps": FPS,
+            "grid": grid}
+
+    # per parameter set: games, frames, score, collisions, coins
+    totals = {tuple(params.values()): np.zeros(5) for params in grid}
+    writer = ColumnWriter(args.out, meta)
+    start = perf_counter()
+    with Pool(args.workers) as pool:
+        for columns in pool.imap_unordered(play_games, tasks):
+            writer.write(columns)
+            key = tuple(columns[name][0].item() for name in PARAMS)
+            totals[key] += (len(columns["seed"]), columns["frames"].sum(), columns["score"].sum(),
+                            columns["collisions"].sum(), columns["coins"].sum())
+            print(f"\r{writer.rows}/{len(grid) * args.games} games", end="", file=sys.stderr)
+    writer.close()
+    elapsed = perf_counter() - start
+    frames = sum(total[1] for total in totals.values())
+    print(f"\r{writer.rows} games, {frames:.0f} frames in {elapsed:.1f} s with {args.workers} workers, "
+          f"{frames / elapsed:.0f} frames/s", file=sys.stderr)
+
+    print(" ".join(f"{name:>17}" for name in PARAMS) + f" {'survival s':>10} {'score':>8} {'collisions':>10} "
+                                                       f"{'coins':>6}")
+    for key, (games, frames, score, collisions, coins) in totals.items():
+        print(" ".join(f"{value:>17}" for value in key) + f" {frames / games / FPS:10.1f} {score / games:8.1f} "
+                                                          f"{collisions / games:10.2f} {coins / games:6.2f}")
+
+
+if __name__ == "__main__":
+    main()
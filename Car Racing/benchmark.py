@@ -0,0 +1,177 @@
+"""
+Benchmarks of game loop hot paths.
+Runs with SDL dummy video driver and saves results to JSON, so builds can be compared:
+
+    python benchmark.py --out baseline.json
+    python benchmark.py --compare baseline.json
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import json
+import platform
+import random
+import sys
+from time import perf_counter
+import numpy as np
+import pygame
+from game_items import *
+from game_scores import ScoreStore
+
+COUNTS = (10, 100, 1000)
+
+
+def measure(func, repeat: int, prepare=None):
+    """
+    Calls function repeat times and measures every call separately.
+    :param func: measured function
+    :param repeat: number of calls
+    :param prepare: function called before every measured call, its time is not counted
+    :return: dict with median, min and p95 of call time in microseconds
+    """
+    times = np.empty(repeat)
+    for i in range(repeat):
+        if prepare is not None:
+            prepare()
+        start = perf_counter()
+        func()
+        times[i] = perf_counter() - start
+    times *= 1e6
+    return {"median_us": float(np.median(times)), "min_us": float(times.min()),
+            "p95_us": float(np.percentile(times, 95)), "calls": repeat}
+
+
+def fill(objects: RoadObjects, models: list, count: int):
+    """
+    Puts count objects on the road lines, evenly spread from above the screen to its bottom.
+    :param objects: Enemies or Coins
+    :param models: paths to models of objects
+    :param count: number of objects
+    """
+    objects.reset()
+    rng = random.Random(count)
+    for i in range(count):
+        line = rng.randrange(28, 74, 15)
+        road_line = DP_HEIGHT * (line / 100) + DP_DELTA
+        rotate = road_line < DP_WIDTH / 2 and objects.__class__ is Enemies
+        model = get_model_spec(models[i % len(models)], 180 * rotate)
+        bottom = DP_HEIGHT - 20 - i * (DP_HEIGHT + 300) // count
+        objects.store.spawn(model, road_line, bottom, (line - 28) // 15, int(rotate))
+
+
+def run(repeat: int):
+    """
+    Runs all benchmarks.
+    :param repeat: number of measured calls of every benchmark
+    :return: dict of benchmark results
+    """
+    pygame.init()
+    screen = pygame.display.set_mode((DP_WIDTH, DP_HEIGHT))
+    results = {}
+
+    background = Background(screen)
+    user_car = Car(screen, CAR_PATH)
+    user_car.health = 10 ** 9
+    enemies = Enemies(screen, random.Random(1))
+    coins = Coins(screen, random.Random(1))
+
+    results["RoadObject.__init__"] = measure(
+        lambda: RoadObject(screen, CARS_PATH[random.randrange(len(CARS_PATH))], DP_WIDTH // 2, -120, True), repeat)
+    results["Background.draw"] = measure(background.draw, repeat)
+    results["show_player_info"] = measure(
+        lambda: show_player_info(False, screen, 0, coins, user_car, random.randrange(1000), background), repeat)
+    scores = ScoreStore(None)
+    for score in (1000, 250, 640):
+        scores.add(score, score // 50, score * FPS, USER_CAR_MODEL)
+    results["show_score_info"] = measure(lambda: show_score_info(False, screen, scores, background), repeat)
+
+    def unblock_user_car():
+        user_car.immortal = False
+
+    for count in COUNTS:
+        fill(enemies, CARS_PATH, count)
+        fill(coins, [COIN_PATH], count)
+        speeds = iter([2, -2] * repeat)
+
+        def spawn_enemy():
+            enemies.store.y[enemies.store.newest] = DP_HEIGHT
+
+        def drop_spawned():
+            enemies.store.kill([enemies.store.newest])
+            spawn_enemy()
+
+        spawn_enemy()
+        results[f"Enemies.generate[{count}]"] = measure(enemies.generate, repeat, drop_spawned)
+        fill(enemies, CARS_PATH, count)
+        results[f"RoadObjects.move[{count}]"] = measure(lambda: coins.move(next(speeds)), repeat)
+        results[f"Enemies.move[{count}]"] = measure(lambda: enemies.move(next(speeds)), repeat)
+        results[f"Enemies.collision_action[{count}]"] = measure(
+            lambda: enemies.collision_action(user_car, 0), repeat, unblock_user_car)
+        results[f"Coins.collision_action[{count}]"] = measure(lambda: coins.collision_action(user_car, 0), repeat)
+        results[f"RoadObjects.draw[{count}]"] = measure(enemies.draw, repeat)
+        results[f"show_dev_info[{count}]"] = measure(
+            lambda: show_dev_info(True, screen, 1.5, user_car, background, enemies, coins, 45), repeat)
+
+    pygame.quit()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """
+    Prints results next to baseline.
+    :param results: dict of benchmark results
+    :param baseline: dict of baseline benchmark results
+    :param tolerance: allowed slowdown, 0.2 means 20%
+    :return: list of regressed benchmarks
+    """
+    regressions = []
+    print(f"{'benchmark':40} {'baseline us':>12} {'current us':>12} {'ratio':>7}")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f"{name:40} {'-':>12} {result['median_us']:12.2f}")
+            continue
+        ratio = result["median_us"] / old["median_us"] if old["median_us"] else float("inf")
+        mark = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            mark = " REGRESSION"
+        print(f"{name:40} {old['median_us']:12.2f} {result['median_us']:12.2f} {ratio:7.2f}{mark}")
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="benchmarks of game loop hot paths")
+    parser.add_argument("--out", help="save results to JSON file", type=str)
+    parser.add_argument("--compare", help="compare results with baseline JSON file", type=str)
+    parser.add_argument("--repeat", help="number of measured calls of every benchmark", type=int, default=300)
+    parser.add_argument("--tolerance", help="allowed slowdown against baseline", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    report = {
+        "meta": {"python": platform.python_version(), "pygame": pygame.version.ver, "numpy": np.__version__,
+                 "platform": platform.platform(), "repeat": args.repeat},
+        "results": results,
+    }
+
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+    elif not args.out:
+        for name, result in results.items():
+            print(f"{name:40} {result['median_us']:12.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Builds sprite bundle: every sprite of the game pre-scaled for DP_WIDTH x DP_HEIGHT and stored as raw RGBA
+in one file, which the game memory-maps instead of decoding and scaling PNG files:
+
+    python build_assets.py
+    python build_assets.py --measure
+
+Bundle has to be rebuilt after screen size change, sprites of changed images are loaded from PNG files
+until then.
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import json
+import subprocess
+import sys
+from time import perf_counter
+
+
+def build(file_path: str):
+    """
+    Renders all sprites from PNG files and writes them to bundle.
+    :param file_path: path to output file
+    :return: number of sprites and size of bundle in bytes
+    """
+    import pygame
+    from game_assets import SpriteBundle, sprite_cache
+    from game_items import preload_sprites
+
+    pygame.init()
+    sprite_cache.bundle = None
+    sprite_cache.maxsize = sys.maxsize
+    sprite_cache.clear()
+    preload_sprites()
+    rendered = dict(sprite_cache.items())
+
+    # sprites which are only steps to others, like unscaled background, are not needed with bundle
+    sprite_cache.bundle = _Recorder(rendered)
+    sprite_cache.clear()
+    preload_sprites()
+    sprites = [(key, rendered[key]) for key in sprite_cache.bundle.keys]
+    SpriteBundle.write(file_path, sprites)
+    pygame.quit()
+    return len(sprites), os.path.getsize(file_path)
+
+
+class _Recorder:
+    def __init__(self, sprites: dict):
+        """
+        Stand-in for SpriteBundle which serves all rendered sprites and remembers which were asked for.
+        :param sprites: dict of sprite cache key and surface
+        """
+        self.sprites = sprites
+        self.keys = []
+
+    def get(self, key: tuple):
+        self.keys.append(key)
+        return self.sprites[key]
+
+
+def _read_io():
+    """
+    :return: dict of read counters of this process, empty on systems without /proc
+    """
+    try:
+        with open("/proc/self/io") as file:
+            return {name: int(value) for name, value in (line.split(": ") for line in file)}
+    except OSError:
+        return {}
+
+
+def probe(use_bundle: bool):
+    """
+    Measures loading of all sprites in a display mode, runs in fresh process started by measure.
+    :param use_bundle: load sprites from bundle
+    :return: dict of startup time and read counters
+    """
+    io = _read_io()
+    start = perf_counter()
+    import game_config
+
+    if not use_bundle:
+        game_config.SPRITE_BUNDLE = None
+    import pygame
+    from game_config import DP_WIDTH, DP_HEIGHT
+    from game_assets import sprite_cache
+    from game_items import preload_sprites
+
+    pygame.init()
+    pygame.display.set_mode((DP_WIDTH, DP_HEIGHT))
+    sprites_start = perf_counter()
+    preload_sprites()
+    end = perf_counter()
+    after = _read_io()
+    return {"startup_ms": (end - start) * 1000, "sprites_ms": (end - sprites_start) * 1000,
+            "sprites": len(sprite_cache),
+            "bundle_hits": sprite_cache.bundle.hits if sprite_cache.bundle is not None else 0,
+            "read_bytes": after.get("rchar", 0) - io.get("rchar", 0),
+            "read_calls": after.get("syscr", 0) - io.get("syscr", 0)}
+
+
+def measure(repeat: int):
+    """
+    Compares startup with and without bundle, every run is a fresh process.
+    :param repeat: number of runs of each variant, median is printed
+    """
+    print(f"{'':10} {'startup ms':>10} {'sprites ms':>10} {'sprites':>8} {'from bundle':>11} {'read KB':>9} "
+          f"{'read calls':>10}")
+    for use_bundle in (False, True):
+        runs = []
+        command = [sys.executable, os.path.abspath(__file__), "--probe"] + ([] if use_bundle else ["--no-bundle"])
+        for _ in range(repeat):
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(output.splitlines()[-1]))
+        runs.sort(key=lambda run: run["startup_ms"])
+        run = runs[len(runs) // 2]
+        print(f"{'bundle' if use_bundle else 'png':10} {run['startup_ms']:10.1f} {run['sprites_ms']:10.1f} "
+              f"{run['sprites']:8} {run['bundle_hits']:11} {run['read_bytes'] / 1024:9.0f} {run['read_calls']:10}")
+
+
+def main():
+    import argparse
+    from game_config import SPRITE_BUNDLE
+
+    parser = argparse.ArgumentParser(description="build pre-scaled sprite bundle")
+    parser.add_argument("--out", help="path to bundle", type=str, default=SPRITE_BUNDLE)
+    parser.add_argument("--measure", help="compare startup with and without bundle", action="store_true")
+    parser.add_argument("--repeat", help="runs of every variant when measuring", type=int, default=5)
+    parser.add_argument("--probe", help=argparse.SUPPRESS, action="store_true")
+    parser.add_argument("--no-bundle", help=argparse.SUPPRESS, action="store_true")
+    args = parser.parse_args()
+
+    if args.probe:
+        print(json.dumps(probe(not args.no_bundle)))
+    elif args.measure:
+        measure(args.repeat)
+    else:
+        count, size = build(args.out)
+        print(f"{args.out}: {count} sprites, {size / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Reads frame sequence files recorded with main.py --capture:
+
+    python main.py --capture game.capture
+    python capture_tool.py game.capture
+    python capture_tool.py game.capture --png frames --every 30
+
+Bench mode renders a headless game at full screen size with capture enabled and reports time which
+capture takes from the game loop, frames dropped by the writer and size of the file:
+
+    python capture_tool.py --bench --seconds 10
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import sys
+import tempfile
+from time import perf_counter
+import numpy as np
+import pygame
+from game_capture import CaptureError, read_frames, to_rgb
+
+
+def show(file_path: str, png_dir: str = None, every: int = 1):
+    """
+    Decodes every frame of capture, prints its statistics and optionally saves frames as PNG.
+    :param file_path: path to capture
+    :param png_dir: directory for PNG files, None - frames are only decoded
+    :param every: every n-th decoded frame is saved
+    """
+    header, frames = read_frames(file_path)
+    if png_dir:
+        os.makedirs(png_dir, exist_ok=True)
+    size = (header["width"], header["height"])
+    count = saved = 0
+    first = last = None
+    start = perf_counter()
+    for index, step, time, pixels in frames:
+        if first is None:
+            first = index, time
+        last = index, time
+        if png_dir and count % every == 0:
+            image = pygame.image.frombuffer(to_rgb(pixels, header["masks"]).tobytes(), size, "RGB")
+            pygame.image.save(image, os.path.join(png_dir, f"frame-{index:06}-step-{step:06}.png"))
+            saved += 1
+        count += 1
+    elapsed = perf_counter() - start
+    if first is None:
+        print(f"{file_path}: {size[0]}x{size[1]}, no frames")
+        return
+    rendered = last[0] - first[0] + 1
+    print(f"{file_path}: {size[0]}x{size[1]}, {count} frames of {rendered} rendered in {last[1] - first[1]:.1f} s, "
+          f"{os.path.getsize(file_path) / 2 ** 20:.1f} MB, decoded in {elapsed:.1f} s")
+    if png_dir:
+        print(f"{saved} frames saved to {png_dir}")
+
+
+def bench(seconds: float):
+    """
+    Plays headless game with capture, checks the last written frame against the screen
+    and prints capture overhead.
+    :param seconds: game time of measurement
+    :return: True when decoded frame matches the screen
+    """
+    from game_config import FPS, RENDER_FPS, DP_WIDTH, DP_HEIGHT
+    from game_capture import FrameCapture
+    from game_engine import Simulation
+    from game_render import Renderer
+    from game_scores import ScoreStore
+    from batch import dodge_policy
+
+    pygame.init()
+    screen = pygame.display.set_mode((DP_WIDTH, DP_HEIGHT))
+    simulation = Simulation(seed=1, screen=screen)
+    renderer = Renderer(screen)
+    renderer.scores = ScoreStore(None)
+    file_path = os.path.join(tempfile.mkdtemp(), "bench.capture")
+    capture = FrameCapture(file_path, screen)
+    policy = dodge_policy(1)
+
+    frames = int(seconds * RENDER_FPS)
+    steps_per_frame = FPS / RENDER_FPS
+    accumulator = 0.0
+    start = perf_counter()
+    for i in range(frames):
+        accumulator += steps_per_frame
+        while accumulator >= 1:
+            if not simulation.step(policy(simulation)):
+                simulation.reset(2 + i)
+            accumulator -= 1
+        renderer.render(simulation, False)
+        renderer.present()
+        capture.add(screen, simulation.frame_count)
+        delay = start + (i + 1) / RENDER_FPS - perf_counter()
+        if delay > 0:
+            pygame.time.wait(int(delay * 1000))
+    elapsed = perf_counter() - start
+    summary = capture.summary()
+
+    # one more frame is added when writer has caught up, it must be the last one in file
+    while capture.queued:
+        pygame.time.wait(10)
+    added = capture.add(screen, simulation.frame_count)
+    expected = pygame.surfarray.array2d(screen).T.astype(np.uint32)
+    capture.close()
+    decoded = None
+    for decoded in read_frames(file_path)[1]:
+        pass
+    matches = added and decoded is not None and decoded[0] == frames and np.array_equal(decoded[3], expected)
+    per_frame = summary["mb"] * 1024 / max(summary["written"], 1)
+    print(f"{frames} frames at {DP_WIDTH}x{DP_HEIGHT} in {elapsed:.1f} s: {summary['written']} written, "
+          f"{summary['dropped']} dropped, {summary['mb']:.1f} MB ({per_frame:.0f} KB per frame)")
+    print(f"main thread ms p50 {summary['main_ms'][0]:.2f} p99 {summary['main_ms'][1]:.2f}, "
+          f"CPU ms p50 {summary['main_cpu_ms'][0]:.2f} p99 {summary['main_cpu_ms'][1]:.2f}")
+    print(f"writer ms p50 {summary['encode_ms'][0]:.1f} p99 {summary['encode_ms'][1]:.1f}")
+    print(f"last frame decoded: {'yes' if matches else 'NO'}")
+    os.remove(file_path)
+    return matches
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="reader of game frame captures")
+    parser.add_argument("capture", help="frame sequence file made by main.py --capture", nargs="?")
+    parser.add_argument("--png", help="save decoded frames as PNG files to directory", type=str)
+    parser.add_argument("--every", help="save every n-th frame", type=int, default=1)
+    parser.add_argument("--bench", help="measure capture of headless game", action="store_true")
+    parser.add_argument("--seconds", help="game time of bench", type=float, default=10)
+    args = parser.parse_args()
+
+    if args.bench:
+        sys.exit(0 if bench(args.seconds) else 1)
+    if not args.capture:
+        parser.error("capture file is needed without --bench")
+    try:
+        show(args.capture, args.png, args.every)
+    except (CaptureError, OSError) as error:
+        sys.exit(error)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import json
+import mmap
+import os
+import struct
+from collections import OrderedDict
+import pygame
+from game_config import ASSET_CACHE_SIZE, BASE_DIR, DP_WIDTH, DP_HEIGHT, SPRITE_BUNDLE
+
+BUNDLE_MAGIC = b"CRBNDL1\n"
+_INDEX_SIZE = struct.Struct("<I")
+
+
+class LRUCache:
+    def __init__(self, maxsize: int):
+        """
+        Bounded mapping that evicts the least recently used entry.
+        :param maxsize: max number of entries kept in cache
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, factory):
+        """
+        Returns cached value for key, creates it with factory on miss.
+        :param key: hashable cache key
+        :param factory: callable without arguments that builds the value
+        :return: cached value
+        """
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            value = factory()
+            self._items[key] = value
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+            return value
+
+        self.hits += 1
+        self._items.move_to_end(key)
+        return value
+
+    def clear(self):
+        """
+        Drops all entries and resets counters.
+        """
+        self._items.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        :return: dict with size and hit/miss counters of cache
+        """
+        return {"size": len(self._items), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+    def items(self):
+        """
+        :return: list of cached (key, value) pairs from the least recently used
+        """
+        return list(self._items.items())
+
+
+class SpriteBundle:
+    def __init__(self, file_path: str):
+        """
+        Pre-scaled sprites in one file of raw RGBA pixels with JSON index. File is memory-mapped,
+        pixels are read from disk only when a sprite is used.
+        Sprites of source images changed after the build are ignored, screen size must match the build.
+        :param file_path: path to bundle written by SpriteBundle.write
+        """
+        self.file_path = file_path
+        self.hits = 0
+        with open(file_path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        if self._map[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            raise ValueError(f"{file_path}: not a sprite bundle")
+        (size,) = _INDEX_SIZE.unpack_from(self._map, len(BUNDLE_MAGIC))
+        start = len(BUNDLE_MAGIC) + _INDEX_SIZE.size
+        index = json.loads(self._map[start:start + size])
+        self._data = start + size
+
+        self.entries = {}
+        if tuple(index["screen"]) != (DP_WIDTH, DP_HEIGHT):
+            return
+        fresh = {source for source, stamp in index["sources"].items() if _stamp(source) == stamp}
+        for source, width, height, rotation, offset, image_width, image_height in index["entries"]:
+            if source in fresh:
+                size = (width, height) if width is not None else None
+                key = (os.path.join(BASE_DIR, source), size, rotation)
+                self.entries[key] = (offset, image_width, image_height)
+
+    def get(self, key: tuple):
+        """
+        :param key: sprite cache key, tuple of image path, size and rotation
+        :return: surface which uses bundle memory, None when sprite is not in bundle
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        offset, width, height = entry
+        start = self._data + offset
+        return pygame.image.frombuffer(memoryview(self._map)[start:start + width * height * 4], (width, height),
+                                       "RGBA")
+
+    @staticmethod
+    def write(file_path: str, sprites: list):
+        """
+        Writes bundle of sprites.
+        :param file_path: path to output file
+        :param sprites: list of (sprite cache key, surface)
+        """
+        sources = {}
+        entries = []
+        chunks = []
+        offset = 0
+        for (image_path, size, rotation), image in sprites:
+            source = os.path.relpath(image_path, BASE_DIR)
+            sources[source] = _stamp(source)
+            pixels = pygame.image.tostring(image, "RGBA")
+            entries.append((source, *(size or (None, None)), rotation, offset, *image.get_size()))
+            chunks.append(pixels)
+            offset += len(pixels)
+        index = json.dumps({"screen": (DP_WIDTH, DP_HEIGHT), "sources": sources, "entries": entries}).encode()
+        # running games may have the old bundle mapped, it is replaced instead of overwritten
+        temp_path = file_path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(BUNDLE_MAGIC + _INDEX_SIZE.pack(len(index)) + index)
+            for pixels in chunks:
+                file.write(pixels)
+        os.replace(temp_path, file_path)
+
+
+def _stamp(source: str):
+    """
+    :param source: path of image relative to game directory
+    :return: size and modification time of image file, None when it is missing
+    """
+    try:
+        stat = os.stat(os.path.join(BASE_DIR, source))
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class SpriteCache(LRUCache):
+    def __init__(self, maxsize: int, bundle_path: str = None):
+        """
+        LRU cache of ready to blit sprites.
+        :param maxsize: max number of sprites kept in cache
+        :param bundle_path: sprite bundle used before PNG files, ignored when file does not exist
+        """
+        super().__init__(maxsize)
+        self.bundle = None
+        if bundle_path and os.path.exists(bundle_path):
+            self.bundle = SpriteBundle(bundle_path)
+
+    def load(self, image_path: str, size: tuple = None, rotation: int = 0):
+        """
+        Returns ready to blit surface, every image is read from disk and transformed only once.
+        Returned surfaces are shared between callers and must not be drawn on.
+        :param image_path: path to image
+        :param size: target (width, height) of image, None keeps original size
+        :param rotation: rotation angle in degrees
+        :return: scaled and rotated surface
+        """
+        if size is not None:
+            size = (int(size[0]), int(size[1]))
+        return self.get((image_path, size, rotation), lambda: self._build(image_path, size, rotation))
+
+    def _build(self, image_path: str, size: tuple, rotation: int):
+        image = self.bundle.get((image_path, size, rotation)) if self.bundle is not None else None
+        if image is None:
+            if rotation:
+                image = pygame.transform.rotate(self.load(image_path, size), rotation)
+            elif size is not None:
+                image = pygame.transform.scale(self.load(image_path), size)
+            else:
+                image = pygame.image.load(image_path)
+
+        # convert_alpha() needs a display mode, headless runs keep the file's pixel format
+        if pygame.display.get_init() and pygame.display.get_surface() is not None:
+            image = image.convert_alpha()
+        return image
+
+
+sprite_cache = SpriteCache(ASSET_CACHE_SIZE, SPRITE_BUNDLE)
@@ -0,0 +1,261 @@
+import os
+import queue
+import struct
+import threading
+import zlib
+from collections import deque
+from time import perf_counter, thread_time
+import numpy as np
+from game_config import CAPTURE_POOL_SIZE, CAPTURE_KEYFRAME, CAPTURE_TILE, CAPTURE_LEVEL, CAPTURE_WRITER_NICE, \
+    PROFILE_FRAMES
+
+MAGIC = b"CRCP"
+VERSION = 1
+KEY, DELTA = range(2)
+
+# magic, version, width, height, tile height, tile width, red, green and blue masks of 32-bit pixels
+_HEADER = struct.Struct("<4sBHHHHIII")
+# kind, rendered frame, simulation step, seconds since capture start, payload size
+_CHUNK = struct.Struct("<BIIdI")
+
+
+class CaptureError(Exception):
+    pass
+
+
+class FrameGrid:
+    def __init__(self, width: int, height: int, tile: tuple = CAPTURE_TILE):
+        """
+        Frame of 32-bit pixels split in tiles. Frames are padded to whole tiles, padding stays black.
+        :param width: width of frame in pixels
+        :param height: height of frame in pixels
+        :param tile: height and width of tile
+        """
+        self.width = width
+        self.height = height
+        self.tile = tile
+        self.rows = -(-height // tile[0])
+        self.columns = -(-width // tile[1])
+        self.shape = (self.rows * tile[0], self.columns * tile[1])
+        self.mask_size = -(-self.rows * self.columns // 8)
+
+    def new_frame(self):
+        return np.zeros(self.shape, np.uint32)
+
+    def tiles(self, frame: np.ndarray):
+        """
+        :param frame: padded frame
+        :return: view of frame with axes tile row, tile column, row in tile, column in tile
+        """
+        return frame.reshape(self.rows, self.tile[0], self.columns, self.tile[1]).swapaxes(1, 2)
+
+    def encode(self, frame: np.ndarray, delta: np.ndarray, previous: np.ndarray = None):
+        """
+        Encodes tiles which differ from the previous frame: bit mask of changed tiles
+        and zlib compressed XOR of their pixels.
+        :param frame: padded frame
+        :param delta: padded frame which gets XOR of frames
+        :param previous: previous frame, None for keyframe
+        :return: payload bytes
+        """
+        if previous is None:
+            np.copyto(delta, frame)
+        else:
+            np.bitwise_xor(frame, previous, out=delta)
+        tiles = self.tiles(delta)
+        changed = tiles.any(axis=(2, 3))
+        return np.packbits(changed).tobytes() + zlib.compress(tiles[changed], CAPTURE_LEVEL)
+
+    def decode(self, payload: bytes, frame: np.ndarray):
+        """
+        Applies payload to frame in place.
+        :param payload: payload made by encode
+        :param frame: previous frame, zeroed frame for keyframe
+        """
+        changed = np.unpackbits(np.frombuffer(payload, np.uint8, self.mask_size))
+        changed = changed[:self.rows * self.columns].reshape(self.rows, self.columns).astype(bool)
+        tiles = self.tiles(frame)
+        tiles[changed] ^= np.frombuffer(zlib.decompress(payload[self.mask_size:]), np.uint32).reshape(
+            -1, *self.tile)
+
+
+class FrameCapture:
+    def __init__(self, file_path: str, screen, pool_size: int = CAPTURE_POOL_SIZE,
+                 keyframe: int = CAPTURE_KEYFRAME, tile: tuple = CAPTURE_TILE):
+        """
+        Records rendered frames to a frame sequence file. Game loop copies the screen into a free buffer
+        of a fixed pool and hands it to writer thread, which encodes frames as changed tiles against
+        the previous written frame. When no buffer is free, writer is behind and the frame is dropped,
+        so the game loop never waits for encoding or disk.
+        :param file_path: path to output file
+        :param screen: screen created with pygame surface, 32-bit pixels
+        :param pool_size: number of buffers for frames waiting for writer
+        :param keyframe: written frames between keyframes, file can be read from a keyframe after damage
+        :param tile: height and width of tile compared with previous frame
+        """
+        if screen.get_bytesize() != 4:
+            raise CaptureError(f"capture needs 32-bit screen, screen has {screen.get_bitsize()} bits")
+        self.file_path = file_path
+        self.keyframe = keyframe
+        self.grid = FrameGrid(screen.get_width(), screen.get_height(), tile)
+        self.frames = 0
+        self.written = 0
+        self.dropped = 0
+        self.bytes = 0
+        # main thread wall and CPU time of add and writer time of encode of the last frames, milliseconds
+        self.add_ms = deque(maxlen=PROFILE_FRAMES)
+        self.add_cpu_ms = deque(maxlen=PROFILE_FRAMES)
+        self.encode_ms = deque(maxlen=PROFILE_FRAMES)
+        self._start = perf_counter()
+
+        self._file = open(file_path, "wb")
+        self._file.write(_HEADER.pack(MAGIC, VERSION, self.grid.width, self.grid.height, *tile,
+                                      *screen.get_masks()[:3]))
+        self._free = queue.Queue()
+        for _ in range(pool_size):
+            self._free.put(self.grid.new_frame())
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def queued(self):
+        """
+        :return: number of frames waiting for writer thread
+        """
+        return self._queue.qsize()
+
+    def add(self, screen, step: int = 0):
+        """
+        Copies presented frame to a free buffer of pool, drops it when writer is behind.
+        :param screen: screen with the frame
+        :param step: simulation step shown by the frame
+        :return: True when frame was queued for writer
+        """
+        start = perf_counter()
+        start_cpu = thread_time()
+        index = self.frames
+        self.frames += 1
+        try:
+            frame = self._free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            frame = None
+        if frame is not None:
+            # view of screen pixels in (x, y) order, its transpose is copied row by row
+            pixels = np.asarray(screen.get_view("2"))
+            np.copyto(frame[:self.grid.height, :self.grid.width], pixels.T.view(np.uint32))
+            del pixels
+            self._queue.put((frame, index, step, start - self._start))
+        self.add_ms.append((perf_counter() - start) * 1000)
+        self.add_cpu_ms.append((thread_time() - start_cpu) * 1000)
+        return frame is not None
+
+    def _run(self):
+        # on one core the writer shares CPU with the game loop, the loop is scheduled first
+        if hasattr(os, "setpriority"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), CAPTURE_WRITER_NICE)
+            except OSError:
+                pass
+        grid = self.grid
+        previous = grid.new_frame()
+        delta = grid.new_frame()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            frame, index, step, time = item
+            start = perf_counter()
+            keyframe = self.written % self.keyframe == 0
+            payload = grid.encode(frame, delta, None if keyframe else previous)
+            self._file.write(_CHUNK.pack(KEY if keyframe else DELTA, index, step, time, len(payload)) + payload)
+            self.encode_ms.append((perf_counter() - start) * 1000)
+            self.bytes += _CHUNK.size + len(payload)
+            self.written += 1
+            # written frame is the base of the next delta, the old base goes back to pool
+            self._free.put(previous)
+            previous = frame
+        self._file.close()
+
+    def summary(self):
+        """
+        :return: dict of frame counts, file size in megabytes and p50/p99 of main thread wall and CPU times
+                 and writer times in ms
+        """
+        def percentiles(times):
+            return np.percentile(np.array(times) if times else np.zeros(1), (50, 99)).tolist()
+
+        return {
+            "frames": self.frames,
+            "written": self.written,
+            "dropped": self.dropped,
+            "mb": self.bytes / 2 ** 20,
+            "main_ms": percentiles(self.add_ms),
+            "main_cpu_ms": percentiles(self.add_cpu_ms),
+            "encode_ms": percentiles(self.encode_ms),
+        }
+
+    def close(self):
+        """
+        Writes queued frames and stops writer thread.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+def read_frames(file_path: str):
+    """
+    Reads frame sequence file. Reading stops at the first incomplete or damaged chunk,
+    which is left by a game which did not close capture.
+    :param file_path: path to capture
+    :return: tuple of header dict and generator of (frame, step, time, pixels), pixels are (height, width)
+             array of 32-bit pixels, which is changed by the next frame
+    """
+    file = open(file_path, "rb")
+    data = file.read(_HEADER.size)
+    if len(data) < _HEADER.size or data[:4] != MAGIC:
+        file.close()
+        raise CaptureError(f"{file_path}: not a capture")
+    magic, version, width, height, tile_height, tile_width, *masks = _HEADER.unpack(data)
+    if version != VERSION:
+        file.close()
+        raise CaptureError(f"{file_path}: unsupported version {version}")
+    header = {"width": width, "height": height, "tile": (tile_height, tile_width), "masks": masks}
+    grid = FrameGrid(width, height, (tile_height, tile_width))
+
+    def frames():
+        frame = grid.new_frame()
+        with file:
+            while True:
+                data = file.read(_CHUNK.size)
+                if len(data) < _CHUNK.size:
+                    return
+                kind, index, step, time, size = _CHUNK.unpack(data)
+                payload = file.read(size)
+                if len(payload) < size:
+                    return
+                if kind == KEY:
+                    frame.fill(0)
+                try:
+                    grid.decode(payload, frame)
+                except (zlib.error, ValueError):
+                    return
+                yield index, step, time, frame[:height, :width]
+
+    return header, frames()
+
+
+def to_rgb(pixels: np.ndarray, masks: list):
+    """
+    :param pixels: (height, width) array of 32-bit pixels
+    :param masks: red, green and blue masks of pixels
+    :return: (height, width, 3) array of bytes
+    """
+    rgb = np.empty((*pixels.shape, 3), np.uint8)
+    for channel, mask in enumerate(masks):
+        shift = (mask & -mask).bit_length() - 1
+        rgb[:, :, channel] = (pixels & mask) >> shift
+    return rgb
@@ -1,27 +1,108 @@
-from os import path
+from os import listdir, path
+
+BASE_DIR = path.dirname(path.abspath(__file__))
+
+
+def asset_path(relative: str):
+    """
+    Resolves path relative to the game directory, so the game starts from any working directory.
+    Letter case of every part is matched against names on disk, paths work on case-sensitive file systems too.
+    :param relative: path with "/" separators
+    :return: absolute path, not existing parts are kept as given
+    """
+    current = BASE_DIR
+    for part in relative.split("/"):
+        candidate = path.join(current, part)
+        if not path.exists(candidate) and path.isdir(current):
+            for name in listdir(current):
+                if name.lower() == part.lower():
+                    candidate = path.join(current, name)
+                    break
+        current = candidate
+    return current
+
 
 DP_WIDTH = 1600
 DP_HEIGHT = 900
 DP_DELTA = (DP_WIDTH - DP_HEIGHT) // 2
 FPS = 30
+RENDER_FPS = 60
+MAX_FRAME_TIME = 0.25
 
 MIN_BG_SPEED = 2
 MAX_BG_SPEED = 20
 DELTA_BG_SPEED = 2
 TIME_TO_BG_SPEED_UP = 5
 
-SCORE = 0
-BEST_SCORE = 0
-PREVIOUS_SCORE = 0
+# log of finished games, compacted to the best games and totals of others, None - scores are kept in memory
+SCORES_PATH = path.join(BASE_DIR, "scores.log")
+SCORE_TOP_SIZE = 10
+SCORE_COMPACT_RECORDS = 256
 
 TIME_TO_GENERATE_ENEMIE = 3
 TIME_TO_GENERATE_COIN = 5
 
 K_HITBOX = 0.85
+# collisions test pixels of sprites, rects scaled by K_HITBOX are used otherwise
+PIXEL_COLLISION = True
+
+ENTITY_POOL_SIZE = 64
+POOL_SIZE_PER_MODEL = 2
 
 USER_CAR_HEALTH = 3
 USER_CAR_INVULNERABLE_TIME = 3
 
+ASSET_CACHE_SIZE = 64
+# pre-scaled sprites made by build_assets.py, missing or outdated bundle falls back to PNG files
+SPRITE_BUNDLE = asset_path("assets/sprites.bundle")
+TEXT_CACHE_SIZE = 256
+
+DIRTY_RECTS = False
+
+# world is drawn into a surface of this fraction of screen size and upscaled, HUD stays sharp
+RENDER_SCALE = 1.0
+ADAPTIVE_QUALITY = False
+# quality levels from the best: render scale, per-enemy dev labels, parallax background layers.
+# Cheap cuts go first, nearest upscale of non-integer scales costs more than it saves on fast machines
+QUALITY_LEVELS = [(1.0, True, True), (1.0, False, True), (1.0, False, False), (0.5, False, False)]
+# quality drops when average frame time exceeds this part of frame budget, and returns below the second one
+QUALITY_DROP = 0.9
+QUALITY_RESTORE = 0.5
+
+PROFILE_FRAMES = 1024
+INPUT_BUFFER_SIZE = 64
+PROFILE_OUT = None
+
+RECORD_PATH = None
+REPLAY_PATH = None
+REPLAY_HEADLESS = False
+
+# memory samples of long sessions: tracemalloc growth by game_items.py function, caches and live surfaces
+MEMORY_STATS = False
+MEMORY_OUT = None
+MEMORY_INTERVAL = 30
+MEMORY_TRACE_FRAMES = 10
+MEMORY_WARN_MB = 32
+# live surfaces and fonts are counted by walking all Python objects, a sample then takes a fraction of second
+MEMORY_CENSUS = False
+
+# world state is published to spectators on "host:port" or "unix:path", see telemetry_client.py
+TELEMETRY_ADDRESS = None
+TELEMETRY_QUEUE_SIZE = 8
+TELEMETRY_KEYFRAME = 150
+TELEMETRY_BACKLOG = 256 * 1024
+
+# rendered frames are recorded to a frame sequence file, see capture_tool.py
+CAPTURE_PATH = None
+# frames waiting for writer thread, frames which find no free buffer are dropped
+CAPTURE_POOL_SIZE = 4
+CAPTURE_KEYFRAME = 120
+# height and width of tiles compared with the previous frame, only changed tiles are compressed
+CAPTURE_TILE = (30, 50)
+CAPTURE_LEVEL = 1
+# niceness of writer thread on Linux, on a busy core the game loop is scheduled first
+CAPTURE_WRITER_NICE = 10
+
 BLACK = (0, 0, 0)
 BLACKS_ALPHA = [(0, 0, 0, 10), (0, 0, 0, 30), (0, 0, 0, 50), (0, 0, 0, 70), (0, 0, 0, 90), (0, 0, 0, 100)]
 WHITE = (255, 255, 255)
@@ -30,46 +111,143 @@ RED = (255, 0, 0)
 GREEN = (0, 255, 0)
 BLUE = (0, 0, 255)
 
-AUDI = path.abspath("image/cars/right_size/audi.png")
-AMBULANCE = path.abspath("image/cars/right_size/ambulance.png")
-VIPER = path.abspath("image/cars/right_size/black_viper.png")
-CAR = path.abspath("image/cars/right_size/car.png")
-MINI_TRUCK = path.abspath("image/cars/right_size/mini_truck.png")
-MINI_VAN = path.abspath("image/cars/right_size/mini_van.png")
-POLICE = path.abspath("image/cars/right_size/police.png")
-TAXI = path.abspath("image/cars/right_size/taxi.png")
-TRUCK = path.abspath("image/cars/right_size/truck.png")
-
-AUDI_SPIRIT = path.abspath("image/cars/right_size/spirit/audi.png")
-VIPER_SPIRIT = path.abspath("image/cars/right_size/Spirit/black_viper.png")
-CAR_SPIRIT = path.abspath("image/cars/right_size/Spirit/car.png")
-TAXI_SPIRIT = path.abspath("image/cars/right_size/Spirit/taxi.png")
-POLICE_SPIRIT = path.abspath("image/cars/right_size/Spirit/police.png")
+AUDI = asset_path("image/cars/right_size/audi.png")
+AMBULANCE = asset_path("image/cars/right_size/ambulance.png")
+VIPER = asset_path("image/cars/right_size/black_viper.png")
+CAR = asset_path("image/cars/right_size/car.png")
+MINI_TRUCK = asset_path("image/cars/right_size/mini_truck.png")
+MINI_VAN = asset_path("image/cars/right_size/mini_van.png")
+POLICE = asset_path("image/cars/right_size/police.png")
+TAXI = asset_path("image/cars/right_size/taxi.png")
+TRUCK = asset_path("image/cars/right_size/truck.png")
+
+AUDI_SPIRIT = asset_path("image/cars/right_size/spirit/audi.png")
+VIPER_SPIRIT = asset_path("image/cars/right_size/Spirit/black_viper.png")
+CAR_SPIRIT = asset_path("image/cars/right_size/Spirit/car.png")
+TAXI_SPIRIT = asset_path("image/cars/right_size/Spirit/taxi.png")
+POLICE_SPIRIT = asset_path("image/cars/right_size/Spirit/police.png")
 
+POLICE_ANIMATION = [asset_path(f"image/cars/right_size/police_animation/{i}.png") for i in (1, 2, 3)]
+AMBULANCE_ANIMATION = [asset_path(f"image/cars/right_size/ambulance_animation/{i}.png") for i in (1, 2, 3)]
+# models drawn with animation frames instead of the static image, frames must have the size of the model
+ANIMATIONS = {POLICE: POLICE_ANIMATION, AMBULANCE: AMBULANCE_ANIMATION}
+# animation frames per second of game time, user car blinks between spirit and model while invulnerable
+ANIMATION_FPS = 6
+BLINK_FPS = 10
+
+USER_CAR_MODEL = "audi"
 CAR_PATH = AUDI
 CAR_SPIRIT_PATH = AUDI_SPIRIT
 CARS_PATH = [AUDI, AMBULANCE, VIPER, CAR, MINI_TRUCK, MINI_VAN, POLICE, TAXI, TRUCK]
+SPIRITS_PATH = [AUDI_SPIRIT, VIPER_SPIRIT, CAR_SPIRIT, TAXI_SPIRIT, POLICE_SPIRIT]
+
+BG_PATH = asset_path("image/background/background-1_0.png")
+BUTTON_PATH = asset_path("image/buttons/Button08.png")
+COIN_PATH = asset_path("image/coins/coin.png")
 
-BG_PATH = path.abspath("image/background/background-1_0.png")
-BUTTON_PATH = path.abspath("image/buttons/Button08.png")
-COIN_PATH = path.abspath("image/coins/coin.png")
+# extra background layers drawn beside the road: image path, speed factor relative to road, x, width.
+# Layers with different factors must not overlap, e.g. scenery on the screen sides moving at half speed:
+# [(SCENERY_PATH, 0.5, 0, DP_DELTA), (SCENERY_PATH, 0.5, DP_DELTA + DP_HEIGHT, DP_DELTA)]
+BG_LAYERS = []
 
 
 def cliargparse():
     import argparse
-    global USER_CAR_HEALTH, CAR_PATH, CAR_SPIRIT_PATH
+    global USER_CAR_HEALTH, USER_CAR_MODEL, CAR_PATH, CAR_SPIRIT_PATH, DIRTY_RECTS, PROFILE_OUT, RENDER_FPS
+    global RECORD_PATH, REPLAY_PATH, REPLAY_HEADLESS, SPRITE_BUNDLE, RENDER_SCALE, ADAPTIVE_QUALITY, SCORES_PATH
+    global TELEMETRY_ADDRESS, MEMORY_STATS, MEMORY_OUT, MEMORY_CENSUS, CAPTURE_PATH
 
     parser = argparse.ArgumentParser()
 
     parser.add_argument("-m", "--model", help="set user car model", type=str,
                         choices=["viper", "taxi", "police", "corvette"])
     parser.add_argument("--health", help="set user car health", type=int)
+    parser.add_argument("--dirty-rects", help="redraw and update only changed regions of screen",
+                        action="store_true")
+    parser.add_argument("--render-fps", help="set frame rate of drawing, 0 - unlimited", type=int)
+    parser.add_argument("--render-scale", help="draw world at this fraction of screen size, e.g. 0.5", type=float)
+    parser.add_argument("--adaptive-quality", help="lower quality automatically when frames are slow",
+                        action="store_true")
+    parser.add_argument("--profile-out", help="save frame phase timings to .csv or .json file on exit", type=str)
+    parser.add_argument("--record", help="save input log of every game, next games get number in file name",
+                        type=str)
+    parser.add_argument("--replay", help="play input log, model and health are taken from it", type=str)
+    parser.add_argument("--headless", help="play --replay without display as fast as possible and check result",
+                        action="store_true")
+    parser.add_argument("--no-bundle", help="load sprites from PNG files even when asset bundle exists",
+                        action="store_true")
+    parser.add_argument("--memory-stats", help="sample memory use and show it in F1 overlay", action="store_true")
+    parser.add_argument("--memory-out", help="append memory samples as JSON lines to file, implies --memory-stats",
+                        type=str)
+    parser.add_argument("--memory-census", help="count live surfaces and fonts in memory samples, implies "
+                                                "--memory-stats", action="store_true")
+    parser.add_argument("--capture", help="record rendered frames of games to frame sequence file", type=str)
+    parser.add_argument("--telemetry", help="publish world state on host:port or unix:path", type=str)
+    parser.add_argument("--scores", help="set path to score log", type=str)
+    parser.add_argument("--no-scores", help="do not save scores of finished games", action="store_true")
     args = parser.parse_args()
 
+    if args.telemetry:
+        TELEMETRY_ADDRESS = args.telemetry
+
+    if args.capture:
+        CAPTURE_PATH = args.capture
+
+    if args.memory_stats or args.memory_out or args.memory_census:
+        MEMORY_STATS = True
+        MEMORY_OUT = args.memory_out
+        MEMORY_CENSUS = args.memory_census
+
+    if args.scores:
+        SCORES_PATH = args.scores
+    if args.no_scores:
+        SCORES_PATH = None
+
+    if args.no_bundle:
+        SPRITE_BUNDLE = None
+
+    if args.headless and not args.replay:
+        parser.error("--headless needs --replay")
+
+    if args.replay:
+        from game_replay import read_header, ReplayError
+
+        REPLAY_PATH = args.replay
+        REPLAY_HEADLESS = args.headless
+        try:
+            args.model, args.health = read_header(args.replay)
+        except (ReplayError, OSError) as error:
+            parser.error(str(error))
+
+    if args.record:
+        RECORD_PATH = args.record
+
     if args.health:
         USER_CAR_HEALTH = args.health
 
+    if args.dirty_rects:
+        DIRTY_RECTS = True
+
+    if args.render_fps is not None:
+        RENDER_FPS = args.render_fps
+
+    if args.render_scale is not None:
+        if not 0 < args.render_scale <= 1:
+            parser.error("--render-scale must be greater than 0 and at most 1")
+        RENDER_SCALE = args.render_scale
+
+    if args.adaptive_quality:
+        ADAPTIVE_QUALITY = True
+
+    # scaled renderer redraws the whole frame, it has no dirty regions
+    if DIRTY_RECTS and (ADAPTIVE_QUALITY or RENDER_SCALE < 1):
+        parser.error("--dirty-rects cannot be used with --render-scale below 1 or --adaptive-quality")
+
+    if args.profile_out:
+        PROFILE_OUT = args.profile_out
+
     if args.model:
+        USER_CAR_MODEL = args.model
         if args.model.upper() == "VIPER":
             CAR_PATH = VIPER
             CAR_SPIRIT_PATH = VIPER_SPIRIT
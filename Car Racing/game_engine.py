@@ -0,0 +1,106 @@
+import random
+from game_items import Background, Car, Enemies, Coins, Keys
+from game_profiler import NullProfiler, SPAWN, IMMORTAL, MOVEMENT, COLLISION
+from game_config import *
+
+
+class Simulation:
+    def __init__(self, seed: int = None, screen=None, profiler=None, min_speed: int = MIN_BG_SPEED,
+                 max_speed: int = MAX_BG_SPEED, delta_speed: int = DELTA_BG_SPEED, k_hitbox: float = K_HITBOX,
+                 invulnerable_time: int = USER_CAR_INVULNERABLE_TIME, pixel_collision: bool = PIXEL_COLLISION):
+        """
+        Game world without rendering and frame limit.
+        Every run with the same seed and inputs plays the same way, no display or SDL video is needed.
+        Balance values default to game_config and can be changed per simulation, see batch.py.
+        :param seed: seed of spawn generator, random seed if None
+        :param screen: screen created with pygame surface for drawing of objects, None for headless run
+        :param profiler: FrameProfiler which gets timings of simulation phases
+        :param min_speed: starting speed of road
+        :param max_speed: max speed of road
+        :param delta_speed: increase of road speed every TIME_TO_BG_SPEED_UP seconds
+        :param k_hitbox: ratio of hitbox size to model size
+        :param invulnerable_time: seconds of user car immortality after collision
+        :param pixel_collision: bool value, whether collisions test pixel masks instead of hitboxes
+        """
+        self.profiler = profiler if profiler is not None else NullProfiler()
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+        self.delta_speed = delta_speed
+
+        self.background = Background(screen, min_spead=min_speed, max_speed=max_speed)
+        self.user_car = Car(screen, CAR_PATH, k_hitbox=k_hitbox)
+        self.user_car.invulnerable_time = invulnerable_time
+        self.enemies = Enemies(screen, self.rng, k_hitbox, pixel_collision)
+        self.coins = Coins(screen, self.rng, k_hitbox, pixel_collision)
+
+        self.frame_count = 0
+        self.time = 0.0
+        self.score = 0.0
+        self.collisions = 0
+        self.game_over = False
+
+    def reset(self, seed: int = None):
+        """
+        Starts a new game with the same objects.
+        :param seed: seed of spawn generator, random seed if None
+        """
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng.seed(self.seed)
+
+        self.background.reset()
+        self.user_car.reset()
+        self.enemies.reset()
+        self.coins.reset()
+
+        self.frame_count = 0
+        self.time = 0.0
+        self.score = 0.0
+        self.collisions = 0
+        self.game_over = False
+
+    def step(self, inputs: Keys = Keys.NONE):
+        """
+        Advances game world by one frame.
+        :param inputs: control keys pressed in this frame
+        :return: False when user car is destroyed
+        """
+        if self.game_over:
+            return False
+
+        self.frame_count += 1
+        self.time = self.frame_count / FPS
+        self.score += 0.01 * self.background.speed
+
+        profiler = self.profiler
+        self.enemies.generate()
+        self.coins.generate()
+        profiler.lap(SPAWN)
+
+        self.user_car.make_immortal(self.time)
+        profiler.lap(IMMORTAL)
+
+        self.background.move(self.time, delta=self.delta_speed)
+        self.coins.move(self.background.speed)
+        self.enemies.move(self.background.speed)
+        self.user_car.move(inputs)
+        self.enemies.animate(self.time)
+        profiler.lap(MOVEMENT)
+
+        health = self.user_car.health
+        self.game_over = self.enemies.collision_action(self.user_car, self.time)
+        self.collisions += health - self.user_car.health + self.game_over
+        self.coins.collision_action(self.user_car, self.time)
+        profiler.lap(COLLISION)
+        return not self.game_over
+
+    def run(self, policy, max_frames: int):
+        """
+        Runs simulation as fast as possible until the game ends.
+        :param policy: callable which gets simulation and returns Keys for the next frame
+        :param max_frames: max number of frames to simulate
+        :return: number of simulated frames
+        """
+        start = self.frame_count
+        while self.frame_count - start < max_frames and self.step(policy(self)):
+            pass
+        return self.frame_count - start
@@ -0,0 +1,386 @@
+import numpy as np
+import pygame
+
+
+class EntityView:
+    def __init__(self, store, slot: int):
+        """
+        Read only view of one entity of the store, gives it the interface of RoadObject.
+        :param store: EntityStore which holds the entity
+        :param slot: index of entity in store arrays
+        """
+        self.store = store
+        self.slot = slot
+
+    @property
+    def image(self):
+        return self.store.images[self.slot]
+
+    @property
+    def ob_rotate(self):
+        return bool(self.store.direction[self.slot])
+
+    @property
+    def rect(self):
+        return self.store.rect(self.slot)
+
+    @property
+    def hitbox(self):
+        return self.store.hitbox(self.slot)
+
+    @property
+    def mask(self):
+        return self.store.masks[self.slot]
+
+
+class LaneIndex:
+    def __init__(self):
+        """
+        Spatial index of road objects with one bucket per road line.
+        Objects of one line move with the same speed, so bucket keeps them ordered by y:
+        the oldest (lowest on the screen) object comes first.
+        """
+        self.buckets = {}
+        self.left = {}
+        self.right = {}
+
+    def insert(self, lane: int, slot: int, left: int, right: int):
+        """
+        Adds new object as the highest one of its line.
+        :param lane: index of road line
+        :param slot: slot of object in store
+        :param left: left edge of object
+        :param right: right edge of object
+        """
+        bucket = self.buckets.get(lane)
+        if bucket is None:
+            self.buckets[lane] = [slot]
+            self.left[lane] = left
+            self.right[lane] = right
+            return
+        bucket.append(slot)
+        self.left[lane] = min(self.left[lane], left)
+        self.right[lane] = max(self.right[lane], right)
+
+    def clear(self):
+        """
+        Empties all buckets.
+        """
+        self.buckets.clear()
+        self.left.clear()
+        self.right.clear()
+
+    def remove(self, lane: int, slot: int):
+        """
+        :param lane: index of road line
+        :param slot: slot of removed object
+        """
+        self.buckets[lane].remove(slot)
+
+    def overlapping(self, left: int, right: int):
+        """
+        :param left: left edge of checked area
+        :param right: right edge of checked area
+        :return: buckets of road lines which objects can reach the area
+        """
+        return [bucket for lane, bucket in self.buckets.items()
+                if bucket and self.left[lane] < right and left < self.right[lane]]
+
+
+class ModelSpec:
+    def __init__(self, model_id: int, image: pygame.Surface, k_hitbox: float, frames: tuple = None,
+                 mask: pygame.mask.Mask = None):
+        """
+        Sprite and sizes of one model of road objects, computed once and shared by all its objects.
+        :param model_id: index of model in the pools of store
+        :param image: ready to blit sprite of model
+        :param k_hitbox: ratio of hitbox size to sprite size
+        :param frames: animation frames of the size of image, None for static model
+        :param mask: pixel mask of sprite for precise collisions, built from image if None
+        """
+        self.id = model_id
+        self.image = image
+        self.mask = mask if mask is not None else pygame.mask.from_surface(image)
+        self.frames = frames if frames is not None and len(frames) > 1 else None
+        self.width, self.height = image.get_size()
+        self.hit_w = int(self.width * k_hitbox)
+        self.hit_h = int(self.height * k_hitbox)
+        self.hit_dx = self.width // 2 - self.hit_w // 2
+        self.hit_dy = self.height // 2 - self.hit_h // 2
+
+
+class EntityStore:
+    FIELDS = ("x", "y", "prev_y", "w", "h", "hit_dx", "hit_dy", "hit_w", "hit_h", "model", "lane", "direction",
+              "seq", "alive")
+
+    def __init__(self, capacity: int = 16):
+        """
+        Struct of arrays storage of road objects.
+        Rect and hitbox of every entity live in NumPy arrays, so movement, culling and collision
+        are done for all entities at once. Removed entities go back to the pool of their model
+        and are reused by the next spawn of the same model, which only resets their position.
+        :param capacity: initial number of slots
+        """
+        self.capacity = 0
+        self.x = np.zeros(0, np.int32)
+        self.y = np.zeros(0, np.int32)
+        self.prev_y = np.zeros(0, np.int32)
+        self.w = np.zeros(0, np.int32)
+        self.h = np.zeros(0, np.int32)
+        self.hit_dx = np.zeros(0, np.int32)
+        self.hit_dy = np.zeros(0, np.int32)
+        self.hit_w = np.zeros(0, np.int32)
+        self.hit_h = np.zeros(0, np.int32)
+        self.model = np.zeros(0, np.int32)
+        self.lane = np.zeros(0, np.int16)
+        self.direction = np.zeros(0, np.int8)
+        self.seq = np.zeros(0, np.int64)
+        self.alive = np.zeros(0, np.bool_)
+        self.images = []
+        self.masks = []
+        self.animated = {}
+        self.tick = 0
+        self.lanes = LaneIndex()
+        self.pools = {}
+        self.count = 0
+        self.newest = -1
+        self._free = []
+        self._next_seq = 0
+        # rect tests passed by the broad phase and pixel overlaps confirmed by the narrow phase
+        self.broad_hits = 0
+        self.narrow_hits = 0
+        self._grow(capacity)
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self, capacity: int):
+        for name in self.FIELDS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, old.dtype)
+            new[:self.capacity] = old
+            setattr(self, name, new)
+        self.model[self.capacity:] = -1
+        self.images.extend([None] * (capacity - self.capacity))
+        self.masks.extend([None] * (capacity - self.capacity))
+        self._free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def _take_slot(self, model: ModelSpec):
+        pool = self.pools.get(model.id)
+        if pool:
+            return pool.pop()
+
+        if not self._free:
+            # slots parked in pools of other models are refilled before the store grows
+            other = next((pool for pool in self.pools.values() if pool), None)
+            if other is not None:
+                self._free.append(other.pop())
+            else:
+                self._grow(self.capacity * 2)
+        slot = self._free.pop()
+        self._fill(slot, model)
+        return slot
+
+    def _fill(self, slot: int, model: ModelSpec):
+        self.w[slot] = model.width
+        self.h[slot] = model.height
+        self.hit_dx[slot] = model.hit_dx
+        self.hit_dy[slot] = model.hit_dy
+        self.hit_w[slot] = model.hit_w
+        self.hit_h[slot] = model.hit_h
+        self.model[slot] = model.id
+        self.images[slot] = model.image
+        self.masks[slot] = model.mask
+
+    def reserve(self, model: ModelSpec, count: int):
+        """
+        Pre-builds objects of the model, so spawns do not have to prepare slots.
+        :param model: ModelSpec of objects
+        :param count: number of objects kept in pool of the model
+        """
+        pool = self.pools.setdefault(model.id, [])
+        while len(pool) < count:
+            if not self._free:
+                self._grow(self.capacity * 2)
+            slot = self._free.pop()
+            self._fill(slot, model)
+            pool.append(slot)
+
+    def spawn(self, model: ModelSpec, centerx: float, bottom: int, lane: int, direction: int):
+        """
+        Places new entity on the road.
+        :param model: ModelSpec of entity
+        :param centerx: x-coordinate of entity center
+        :param bottom: y-coordinate of entity bottom
+        :param lane: index of road line
+        :param direction: 1 for oncoming (rotated) entity, 0 otherwise
+        :return: slot of new entity
+        """
+        slot = self._take_slot(model)
+
+        x = round(centerx) - model.width // 2
+        y = bottom - model.height
+        self.x[slot] = x
+        self.y[slot] = y
+        self.prev_y[slot] = y
+        self.lane[slot] = lane
+        self.direction[slot] = direction
+        self.seq[slot] = self._next_seq
+        self.alive[slot] = True
+        if model.frames is not None:
+            self.animated[slot] = model.frames
+            self.images[slot] = model.frames[(self.tick + slot) % len(model.frames)]
+        self.lanes.insert(lane, slot, x, x + model.width)
+
+        self._next_seq += 1
+        self.count += 1
+        self.newest = slot
+        return slot
+
+    def clear(self):
+        """
+        Removes all entities, their slots go back to the pools.
+        """
+        self.kill(self.alive.nonzero()[0].tolist())
+        self._next_seq = 0
+        self.tick = 0
+
+    def kill(self, slots):
+        """
+        Removes entities from the road.
+        :param slots: list of entity slots
+        """
+        for slot in slots:
+            self.lanes.remove(int(self.lane[slot]), slot)
+            self.alive[slot] = False
+            self.animated.pop(slot, None)
+            self.pools.setdefault(int(self.model[slot]), []).append(slot)
+        self.count -= len(slots)
+        if self.newest >= 0 and not self.alive[self.newest]:
+            self.newest = self._find_newest()
+
+    def _find_newest(self):
+        if self.count == 0:
+            return -1
+        return int(np.argmax(np.where(self.alive, self.seq, -1)))
+
+    def active(self):
+        """
+        :return: slots of all entities on the road in spawn order
+        """
+        slots = self.alive.nonzero()[0]
+        return slots[np.argsort(self.seq[slots], kind="stable")]
+
+    def animate(self, tick: int):
+        """
+        Switches animated entities to the frame of the tick. Frames are shared by all entities of a model,
+        only the image reference of the slot changes, so drawing costs the same as for static entities.
+        Entities are shifted by their slot number, so neighbours do not blink in sync.
+        :param tick: number of animation frames played since start of the game
+        """
+        self.tick = tick
+        images = self.images
+        for slot, frames in self.animated.items():
+            images[slot] = frames[(tick + slot) % len(frames)]
+
+    def save_positions(self):
+        """
+        Remembers positions of the current step for interpolated drawing.
+        """
+        np.copyto(self.prev_y, self.y)
+
+    def move(self, dy):
+        """
+        Moves all entities down the road.
+        :param dy: shift in pixels, scalar or array with value for every slot
+        """
+        np.add(self.y, dy, out=self.y, where=self.alive, casting="unsafe")
+
+    def cull(self, limit: int):
+        """
+        Removes entities which top edge is below the limit.
+        :param limit: y-coordinate of screen bottom
+        :return: number of removed entities
+        """
+        gone = self.alive & (self.y > limit)
+        if not gone.any():
+            return 0
+        slots = gone.nonzero()[0].tolist()
+        self.kill(slots)
+        return len(slots)
+
+    def collide(self, hitbox: pygame.Rect):
+        """
+        Finds entities which hitbox overlaps the given one, same test as Rect.colliderect.
+        Only road lines under the hitbox are checked, each of them until objects get above the hitbox.
+        :param hitbox: hitbox of checked object
+        :return: list of colliding entity slots
+        """
+        x, y, h = self.x, self.y, self.h
+        hit_dx, hit_dy, hit_w, hit_h = self.hit_dx, self.hit_dy, self.hit_w, self.hit_h
+        hits = []
+        for bucket in self.lanes.overlapping(hitbox.x, hitbox.right):
+            for slot in bucket:
+                top = y[slot]
+                if top + h[slot] <= hitbox.y:
+                    break
+                top += hit_dy[slot]
+                left = x[slot] + hit_dx[slot]
+                if (top < hitbox.bottom and hitbox.y < top + hit_h[slot]
+                        and left < hitbox.right and hitbox.x < left + hit_w[slot]):
+                    hits.append(slot)
+        return hits
+
+    def collide_masks(self, rect: pygame.Rect, mask: pygame.mask.Mask):
+        """
+        Finds entities which pixels overlap pixels of the given object. Sprite rects are the broad phase,
+        masks shared by all entities of a model are tested only for entities which rects overlap.
+        :param rect: sprite rect of checked object
+        :param mask: pixel mask of checked object
+        :return: list of colliding entity slots
+        """
+        x, y, w, h = self.x, self.y, self.w, self.h
+        masks = self.masks
+        hits = []
+        for bucket in self.lanes.overlapping(rect.x, rect.right):
+            for slot in bucket:
+                top = y[slot]
+                if top + h[slot] <= rect.y:
+                    break
+                left = x[slot]
+                if top < rect.bottom and left < rect.right and rect.x < left + w[slot]:
+                    self.broad_hits += 1
+                    if mask.overlap(masks[slot], (int(left) - rect.x, int(top) - rect.y)) is not None:
+                        self.narrow_hits += 1
+                        hits.append(slot)
+        return hits
+
+    def rect(self, slot: int):
+        """
+        :param slot: entity slot
+        :return: pygame.Rect of entity sprite
+        """
+        return pygame.Rect(int(self.x[slot]), int(self.y[slot]), int(self.w[slot]), int(self.h[slot]))
+
+    def hitbox(self, slot: int):
+        """
+        :param slot: entity slot
+        :return: pygame.Rect of entity hitbox
+        """
+        return pygame.Rect(int(self.x[slot] + self.hit_dx[slot]), int(self.y[slot] + self.hit_dy[slot]),
+                           int(self.hit_w[slot]), int(self.hit_h[slot]))
+
+    def blit_items(self, alpha: float = 1.0):
+        """
+        :param alpha: position between previous and current step, 0..1
+        :return: (image, position) pairs of all entities for Surface.blits
+        """
+        slots = self.active()
+        ys = self.y[slots]
+        if alpha < 1:
+            prev = self.prev_y[slots]
+            ys = np.rint(prev + (ys - prev) * alpha).astype(np.int32)
+        images = self.images
+        return [(images[slot], (x, y)) for slot, x, y in
+                zip(slots.tolist(), self.x[slots].tolist(), ys.tolist())]
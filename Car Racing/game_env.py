@@ -0,0 +1,184 @@
+"""
+Reinforcement learning environment over the headless Simulation, API follows Gymnasium:
+
+    env = RacingEnv()
+    observation, info = env.reset(seed=1)
+    observation, reward, terminated, truncated, info = env.step(LEFT)
+
+VecEnv steps several games in lockstep and returns stacked arrays. No window is opened, pixel observations
+are drawn on an off-screen surface.
+"""
+import numpy as np
+import pygame
+from game_engine import Simulation
+from game_items import Keys
+from game_config import *
+
+NOOP, LEFT, RIGHT, UP, DOWN = range(5)
+ACTIONS = (Keys.NONE, Keys.LEFT, Keys.RIGHT, Keys.UP, Keys.DOWN)
+
+LANES = 4
+# lane occupancy, nearest enemy distance per lane, car x and y, speed, health
+OBSERVATION_SIZE = 2 * LANES + 4
+
+COIN_REWARD = 1.0
+COLLISION_PENALTY = 5.0
+
+
+class RacingEnv:
+    action_count = len(ACTIONS)
+    observation_size = OBSERVATION_SIZE
+
+    def __init__(self, pixels: bool = False, pixel_size: tuple = (84, 84), max_steps: int = 600 * FPS,
+                 frame_skip: int = 1, **params):
+        """
+        One game as environment, every step is one or more simulation steps with the same keys.
+        :param pixels: observations are downscaled RGB images of the road instead of state vectors
+        :param pixel_size: width and height of pixel observations
+        :param max_steps: steps after which the episode is truncated
+        :param frame_skip: simulation steps made by one env step
+        :param params: balance values passed to Simulation, k_hitbox without pixel_collision selects
+                       hitbox collisions, pixel masks do not use it
+        """
+        self.pixels = pixels
+        self.pixel_size = pixel_size
+        self.max_steps = max_steps
+        self.frame_skip = frame_skip
+        self.steps = 0
+
+        self._surface = None
+        if pixels:
+            from game_render import Renderer
+
+            self._surface = pygame.Surface((DP_WIDTH, DP_HEIGHT))
+            self._road = self._surface.subsurface((DP_DELTA, 0, DP_HEIGHT, DP_HEIGHT))
+            self._scaled = pygame.Surface(pixel_size)
+            self._renderer = Renderer(self._surface)
+        params.setdefault("pixel_collision", PIXEL_COLLISION and "k_hitbox" not in params)
+        self.simulation = Simulation(screen=self._surface, **params)
+
+        self._observation = np.zeros(OBSERVATION_SIZE, np.float32)
+
+    def reset(self, seed: int = None):
+        """
+        Starts a new episode.
+        :param seed: seed of spawn generator, random seed if None
+        :return: tuple of observation and info dict
+        """
+        self.simulation.reset(seed)
+        self.steps = 0
+        return self.observe(), {"seed": self.simulation.seed}
+
+    def step(self, action: int):
+        """
+        Advances the game.
+        :param action: index in ACTIONS
+        :return: tuple of observation, reward, terminated, truncated and info dict
+        """
+        simulation = self.simulation
+        score, coins, collisions = simulation.score, simulation.coins.count, simulation.collisions
+        keys = ACTIONS[action]
+        for _ in range(self.frame_skip):
+            if not simulation.step(keys):
+                break
+        self.steps += 1
+
+        reward = (simulation.score - score + COIN_REWARD * (simulation.coins.count - coins)
+                  - COLLISION_PENALTY * (simulation.collisions - collisions))
+        terminated = simulation.game_over
+        truncated = not terminated and self.steps >= self.max_steps
+        return self.observe(), reward, terminated, truncated, {"score": simulation.score}
+
+    def observe(self):
+        """
+        :return: observation of the current state, the returned array is reused by the next call
+        """
+        if self.pixels:
+            return self.render_pixels()
+
+        simulation = self.simulation
+        car = simulation.user_car.rect
+        store = simulation.enemies.store
+
+        # there are only a few enemies on the road, plain loop is faster than numpy calls on tiny arrays
+        occupied = [0.0] * LANES
+        distances = [1.0] * LANES
+        slots = store.active()
+        for lane, bottom in zip(store.lane[slots].tolist(), (store.y[slots] + store.h[slots]).tolist()):
+            occupied[lane] = 1.0
+            if bottom <= car.bottom:
+                distance = max(car.top - bottom, 0) / DP_HEIGHT
+                if distance < distances[lane]:
+                    distances[lane] = distance
+
+        observation = self._observation
+        observation[:] = (*occupied, *distances, (car.centerx - DP_DELTA) / DP_HEIGHT, car.bottom / DP_HEIGHT,
+                          simulation.background.speed / simulation.background.max_speed,
+                          simulation.user_car.health / USER_CAR_HEALTH)
+        return observation
+
+    def render_pixels(self):
+        """
+        Draws the road off-screen and downscales it.
+        :return: uint8 array of shape (height, width, 3)
+        """
+        self._renderer.draw_world(self.simulation, 1.0)
+        pygame.transform.smoothscale(self._road, self.pixel_size, self._scaled)
+        return pygame.surfarray.array3d(self._scaled).transpose(1, 0, 2)
+
+
+class VecEnv:
+    def __init__(self, count: int, **kwargs):
+        """
+        Several games stepped in lockstep, finished games are reset automatically.
+        :param count: number of games
+        :param kwargs: arguments of RacingEnv
+        """
+        self.envs = [RacingEnv(**kwargs) for _ in range(count)]
+        self.count = count
+        pixels = self.envs[0].pixels
+        shape = (count, *self.envs[0].pixel_size[::-1], 3) if pixels else (count, OBSERVATION_SIZE)
+        self.observations = np.zeros(shape, np.uint8 if pixels else np.float32)
+        self.rewards = np.zeros(count, np.float64)
+        self.terminated = np.zeros(count, np.bool_)
+        self.truncated = np.zeros(count, np.bool_)
+        self._next_seed = None
+
+    def reset(self, seed: int = None):
+        """
+        Starts new episodes in all games, game i gets seed + i.
+        :param seed: seed of the first game, random seeds if None
+        :return: tuple of stacked observations and list of info dicts
+        """
+        infos = []
+        for i, env in enumerate(self.envs):
+            observation, info = env.reset(None if seed is None else seed + i)
+            self.observations[i] = observation
+            infos.append(info)
+        self._next_seed = None if seed is None else seed + self.count
+        return self.observations, infos
+
+    def step(self, actions):
+        """
+        Advances all games by one step. Games which finished are reset, their last observation is
+        kept in info["final_observation"].
+        :param actions: sequence of action indexes, one for every game
+        :return: tuple of stacked observations, rewards, terminated, truncated and list of info dicts,
+            returned arrays are reused by the next call
+        """
+        infos = []
+        for i, env in enumerate(self.envs):
+            observation, reward, terminated, truncated, info = env.step(actions[i])
+            if terminated or truncated:
+                info["final_observation"] = observation.copy()
+                seed = None
+                if self._next_seed is not None:
+                    seed = self._next_seed
+                    self._next_seed += 1
+                observation, _ = env.reset(seed)
+            self.observations[i] = observation
+            self.rewards[i] = reward
+            self.terminated[i] = terminated
+            self.truncated[i] = truncated
+            infos.append(info)
+        return self.observations, self.rewards, self.terminated, self.truncated, infos
@@ -0,0 +1,126 @@
+from collections import deque
+from enum import IntFlag
+from time import perf_counter
+import pygame
+from game_config import INPUT_BUFFER_SIZE
+
+
+class Keys(IntFlag):
+    """
+    Bit flags of user input read by the game in one frame
+    """
+    NONE = 0
+    LEFT = 1
+    RIGHT = 2
+    UP = 4
+    DOWN = 8
+    ESC = 16
+    F1 = 32
+
+
+CONTROL_KEYS = {pygame.K_LEFT: int(Keys.LEFT), pygame.K_RIGHT: int(Keys.RIGHT), pygame.K_UP: int(Keys.UP),
+                pygame.K_DOWN: int(Keys.DOWN)}
+
+# events which reach the queue, mouse motion and window events are dropped by SDL during the game
+GAME_EVENTS = [pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP]
+MENU_EVENTS = [pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN]
+
+
+def allow_events(types: list):
+    """
+    Restricts event queue to the event types, others are not queued at all.
+    :param types: list of pygame event types
+    """
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed(types)
+
+
+def read_keys():
+    """
+    Function reads state of control keys from keyboard
+    :return: Keys flags of pressed keys
+    """
+    pressed = pygame.key.get_pressed()
+    keys = 0
+    for key, flag in CONTROL_KEYS.items():
+        if pressed[key]:
+            keys |= flag
+    return Keys(keys)
+
+
+class InputBuffer:
+    def __init__(self, size: int = INPUT_BUFFER_SIZE):
+        """
+        Changes of control keys with the time they were taken from event queue.
+        Queue is pumped at the start of frame and every simulation step samples the buffer, so input
+        does not wait for drawing of the frame. Keys pressed and released between two steps are still
+        seen by the next step. Events carry no time of arrival, so changes are stamped with the time
+        of the previous pump: latency includes time the event waited in SDL queue while the loop slept,
+        and is an upper bound which is at most one frame late.
+        :param size: max number of buffered changes, the oldest are dropped when steps do not sample them
+        """
+        self.changes = deque(maxlen=size)
+        self.keys = 0
+        # the earliest time events taken by the next poll could have arrived
+        self.polled_at = perf_counter()
+        # time of the oldest change sampled since the last presented frame
+        self.sampled_at = None
+        self.latency = None
+
+    def reset(self):
+        """
+        Takes state of keys from keyboard, e.g. after a menu which consumed key events.
+        """
+        self.changes.clear()
+        self.keys = int(read_keys())
+        self.sampled_at = None
+        self.polled_at = perf_counter()
+
+    def poll(self):
+        """
+        Pumps event queue and buffers changes of control keys.
+        :return: list of other events
+        """
+        arrived = self.polled_at
+        self.polled_at = perf_counter()
+        other = []
+        for event in pygame.event.get():
+            if event.type in (pygame.KEYDOWN, pygame.KEYUP) and event.key in CONTROL_KEYS:
+                self.changes.append((arrived, CONTROL_KEYS[event.key], event.type == pygame.KEYDOWN))
+            else:
+                other.append(event)
+        return other
+
+    def sample(self):
+        """
+        Applies buffered changes, called at the start of simulation step.
+        :return: Keys held now or pressed since the previous sample
+        """
+        keys = self.keys
+        pressed = 0
+        changes = self.changes
+        if changes and self.sampled_at is None:
+            self.sampled_at = changes[0][0]
+        while changes:
+            _, flag, down = changes.popleft()
+            if down:
+                keys |= flag
+                pressed |= flag
+            else:
+                keys &= ~flag
+        self.keys = keys
+        return Keys(keys | pressed)
+
+    def presented(self, profiler=None):
+        """
+        Measures time from arrival of the oldest input sampled by the frame to its presentation on screen.
+        :param profiler: FrameProfiler which stores latency of the frame
+        :return: latency in milliseconds, None when the frame shows no new input
+        """
+        if self.sampled_at is None:
+            return None
+        self.latency = (perf_counter() - self.sampled_at) * 1000
+        self.sampled_at = None
+        if profiler is not None:
+            profiler.input_latency(self.latency)
+        return self.latency
@@ -1,14 +1,67 @@
+import os
 import pygame
 import random
+import numpy as np
 from abc import ABC, abstractmethod
-import time as tm
+from enum import Enum
 from game_config import *
+from game_assets import sprite_cache
+from game_entities import EntityStore, EntityView, ModelSpec
+from game_text import text_cache, get_atlas, draw_value, draw_values
+from game_menu import Menu, Button
+from game_input import Keys, InputBuffer, GAME_EVENTS, allow_events
+from game_profiler import FrameProfiler, PHASES, COLLISION, EVENTS, DISPLAY, CAPTURE, TELEMETRY
+
+
+class ScrollLayer:
+    def __init__(self, images: list, factor: float, rect: pygame.Rect):
+        """
+        Background images which scroll with the same speed. They are composited once into a strip
+        of two tiles in display format, so the visible window is drawn with a single blit.
+        :param images: list of (image path, x, width), x is relative to rect, images are scaled to screen height
+        :param factor: scroll speed relative to road
+        :param rect: screen area covered by layer
+        """
+        self.images = images
+        self.factor = factor
+        self.rect = rect
+        self._key = (tuple(images), rect.width)
+
+    @property
+    def strip(self):
+        """
+        Strip is built on the first draw and shared by all layers with the same images,
+        headless simulations never build it.
+        :return: surface of two tiles, one above the other
+        """
+        strip = _strips.get(self._key)
+        if strip is None:
+            strip = pygame.Surface((self.rect.width, 2 * DP_HEIGHT))
+            strip.fill(GRAY)
+            for image_path, x, width in self.images:
+                image = sprite_cache.load(image_path, (width, DP_HEIGHT))
+                strip.blit(image, (x, 0))
+                strip.blit(image, (x, DP_HEIGHT))
+            if pygame.display.get_surface() is not None:
+                strip = strip.convert()
+            _strips[self._key] = strip
+        return strip
+
+    def draw(self, screen: pygame.surface, y: int):
+        """
+        :param screen: surface to draw on
+        :param y: scroll offset of layer, 0..DP_HEIGHT
+        """
+        screen.blit(self.strip, self.rect, (0, DP_HEIGHT - y, self.rect.width, DP_HEIGHT))
+
+
+_strips = {}
 
 
 class Background:
 
     def __init__(self, screen: pygame.surface, bg_path: str = BG_PATH, bg_y: int = 0, min_spead: int = MIN_BG_SPEED,
-                 max_speed: int = MAX_BG_SPEED):
+                 max_speed: int = MAX_BG_SPEED, layers: list = BG_LAYERS):
         """
         Creation of background.
         :param screen: screen created with pygame surface for run process
@@ -16,21 +69,87 @@ class Background:
         :param bg_y: y-coordinate of picture on the screen in the current frame
         :param min_spead: starting speed of screen
         :param max_speed: max speed of screen
+        :param layers: extra layers beside the road, list of (image path, speed factor, x, width)
         """
         self.screen = screen
         self.y = bg_y
         self.speed = min_spead
+        self.min_speed = min_spead
         self.max_speed = max_speed
-        self.image = get_background_right_image(bg_path)
-        self.rect = self.image.get_rect(centerx=DP_WIDTH // 2, y=self.y)
-
-    def draw(self):
+        self.rect = pygame.Rect(DP_DELTA, self.y, DP_HEIGHT, DP_HEIGHT)
+        self.prev_y = self.rect.y
+        self.speed_ups = 0
+        # road distance driven, layers with other speed than road scroll by it
+        self.distance = 0
+        self.prev_distance = 0
+
+        # touching images with the same speed are composited together, so extra images cost no extra blits
+        groups = {1.0: [(bg_path, self.rect.x, self.rect.width)]}
+        for image_path, factor, x, width in layers:
+            groups.setdefault(factor, []).append((image_path, x, width))
+        self.layers = []
+        for factor, images in groups.items():
+            clusters = []
+            for image in sorted(images, key=lambda image: image[1]):
+                # images are composited in the given order, sorting is only for finding touching ones
+                if clusters and image[1] <= clusters[-1][1]:
+                    clusters[-1][1] = max(clusters[-1][1], image[1] + image[2])
+                    clusters[-1][2].append(image)
+                else:
+                    clusters.append([image[1], image[1] + image[2], [image]])
+            for left, right, cluster in clusters:
+                cluster.sort(key=images.index)
+                self.layers.append(ScrollLayer([(image_path, x - left, width) for image_path, x, width in cluster],
+                                               factor, pygame.Rect(left, 0, right - left, DP_HEIGHT)))
+        self.set_detail(True)
+
+    def set_detail(self, full: bool):
         """
-        Rendering function of item.
+        Switches parallax layers on or off, without them only layers moving with the road are drawn.
+        :param full: bool value, whether all layers are drawn
+        """
+        self.visible = [layer for layer in self.layers if full or layer.factor == 1.0]
+        self.area = self.visible[0].rect.unionall([layer.rect for layer in self.visible])
+
+        # screen columns which no layer covers
+        self.margins = []
+        x = 0
+        for layer in sorted(self.visible, key=lambda layer: layer.rect.x):
+            if layer.rect.x > x:
+                self.margins.append(pygame.Rect(x, 0, layer.rect.x - x, DP_HEIGHT))
+            x = max(x, layer.rect.right)
+        if x < DP_WIDTH:
+            self.margins.append(pygame.Rect(x, 0, DP_WIDTH - x, DP_HEIGHT))
+
+    def scroll(self, alpha: float = 1.0):
+        """
+        :param alpha: position between previous and current simulation step, 0..1
+        :return: list of visible layers with their scroll offsets
+        """
+        y = self.rect.y
+        if alpha < 1:
+            # background jumps back to 0 after it scrolled the whole screen
+            target = y if y >= self.prev_y else y + DP_HEIGHT
+            y = round(self.prev_y + (target - self.prev_y) * alpha) % DP_HEIGHT
+        distance = self.prev_distance + (self.distance - self.prev_distance) * alpha
+        return [(layer, y if layer.factor == 1.0 else int(distance * layer.factor) % DP_HEIGHT)
+                for layer in self.visible]
+
+    def draw(self, alpha: float = 1.0):
+        """
+        Rendering function of item, every layer is one blit.
+        :param alpha: position between previous and current simulation step, 0..1
         :return: draw background on screen
         """
-        self.screen.blit(self.image, self.rect)
-        self.screen.blit(self.image, (self.rect.x, self.rect.y - DP_HEIGHT))
+        for layer, y in self.scroll(alpha):
+            layer.draw(self.screen, y)
+
+    def draw_margins(self):
+        """
+        Paints screen parts which are not covered by layers.
+        """
+        for rect in self.margins:
+            self.screen.fill(GRAY, rect)
 
     def move(self, time: int, time_to_up: int = TIME_TO_BG_SPEED_UP, delta: int = DELTA_BG_SPEED):
         """
@@ -41,17 +160,33 @@ class Background:
         :param delta: specially calculated unit to increase speed.
         :return: speed of movement
         """
-        if self.speed < self.max_speed:
-            if time != 0 and time % time_to_up == 0:
+        # threshold is passed once even when time does not hit its multiple exactly
+        if time >= (self.speed_ups + 1) * time_to_up:
+            self.speed_ups += 1
+            if self.speed < self.max_speed:
                 self.speed += delta
-        elif self.speed > self.max_speed:
+        if self.speed > self.max_speed:
             self.speed = self.max_speed
 
+        self.prev_y = self.rect.y
+        self.prev_distance = self.distance
+        self.distance += self.speed
         if self.rect.y + self.speed < DP_HEIGHT:
             self.rect.y += self.speed
         else:
             self.rect.y = 0
 
+    def reset(self):
+        """
+        Returns background to its starting position and speed.
+        """
+        self.speed = self.min_speed
+        self.speed_ups = 0
+        self.rect.y = self.y
+        self.prev_y = self.y
+        self.distance = 0
+        self.prev_distance = 0
+
 
 def get_background_right_image(background_path: str):
     """
@@ -59,24 +194,206 @@ def get_background_right_image(background_path: str):
         :param background_path: path to background image
         :return: adaptive background size
         """
-    image = pygame.image.load(background_path)
-    return pygame.transform.scale(image, (DP_HEIGHT, DP_HEIGHT))
+    return sprite_cache.load(background_path, (DP_HEIGHT, DP_HEIGHT))
 
 
-def get_model_right_image(model_path: str):
+def get_model_right_image(model_path: str, rotation: int = 0):
     """
         Function makes models of cars adaptive to size screen
         :param model_path: path to  model image
+        :param rotation: rotation angle of model in degrees
         :return: adaptive model image size
         """
-    image = pygame.image.load(model_path)
+    image = sprite_cache.load(model_path)
     k_height = image.get_height() / image.get_width()
-    return pygame.transform.scale(image, (DP_HEIGHT / 8.5, (DP_HEIGHT / 8.5) * k_height))
+    return sprite_cache.load(model_path, (DP_HEIGHT / 8.5, (DP_HEIGHT / 8.5) * k_height), rotation)
+
+
+def preload_sprites():
+    """
+    Loads every sprite of the game into sprite cache, used by build_assets.py.
+    """
+    from game_menu import get_button_image
+
+    for model_path in CARS_PATH:
+        get_model_right_image(model_path)
+        get_model_right_image(model_path, 180)
+    for model_path in SPIRITS_PATH + [COIN_PATH]:
+        get_model_right_image(model_path)
+    for frames in ANIMATIONS.values():
+        for frame_path in frames:
+            get_model_right_image(frame_path)
+            get_model_right_image(frame_path, 180)
+    get_background_right_image(BG_PATH)
+    for image_path, _, _, width in BG_LAYERS:
+        sprite_cache.load(image_path, (width, DP_HEIGHT))
+    get_button_image()
+
+
+class Animation:
+    def __init__(self, frames, fps: float):
+        """
+        Sequence of ready to blit frames, built once and shared by all objects which play it.
+        Objects only keep time or tick of their animation.
+        :param frames: surfaces of frames
+        :param fps: frames per second of game time
+        """
+        self.frames = tuple(frames)
+        self.fps = fps
+
+    def __len__(self):
+        return len(self.frames)
+
+    def tick(self, time: float):
+        """
+        :param time: game time in seconds
+        :return: number of frames played until time
+        """
+        # game time is frame count / FPS, small epsilon keeps exact multiples from rounding down
+        return int(time * self.fps + 1e-6)
+
+    def frame(self, time: float):
+        """
+        :param time: game time in seconds
+        :return: frame shown at time
+        """
+        return self.frames[self.tick(time) % len(self.frames)]
+
+
+def faded_image(image: pygame.Surface, alpha: int):
+    """
+    :param image: sprite with alpha channel
+    :param alpha: opacity of copy, 0..255
+    :return: semi-transparent copy of sprite
+    """
+    image = image.copy()
+    image.fill((255, 255, 255, alpha), special_flags=pygame.BLEND_RGBA_MULT)
+    return image
+
+
+_animations = {}
+
+
+def get_animation(model_path: str, rotation: int = 0):
+    """
+        Function returns frames of animated model, static models get one frame animation
+        :param model_path: path to model image
+        :param rotation: rotation angle of model in degrees
+        :return: Animation of model
+        """
+    key = (model_path, rotation)
+    animation = _animations.get(key)
+    if animation is None:
+        frame_paths = ANIMATIONS.get(model_path, [model_path])
+        frames = [get_model_right_image(frame_path, rotation) for frame_path in frame_paths]
+        animation = _animations[key] = Animation(frames, ANIMATION_FPS)
+    return animation
+
+
+def get_blink_animation(model_path: str, spirit_path: str = None):
+    """
+        Function returns frames which user car blinks with while invulnerable
+        :param model_path: path to model image
+        :param spirit_path: path to spirit image of model, half transparent model is used without it
+        :return: Animation of spirit and model
+        """
+    key = ("blink", model_path, spirit_path)
+    animation = _animations.get(key)
+    if animation is None:
+        image = get_model_right_image(model_path)
+        spirit = get_model_right_image(spirit_path) if spirit_path else faded_image(image, 110)
+        animation = _animations[key] = Animation((spirit, image), BLINK_FPS)
+    return animation
+
+
+_masks = {}
+
+
+def get_model_mask(model_path: str, rotation: int = 0):
+    """
+        Function returns pixel mask of model sprite, it is built once for every model, rotation and sprite size
+        :param model_path: path to model image
+        :param rotation: rotation angle of model in degrees
+        :return: pygame Mask shared by all objects of model
+        """
+    image = get_animation(model_path, rotation).frames[0]
+    key = (model_path, rotation, image.get_size())
+    mask = _masks.get(key)
+    if mask is None:
+        mask = _masks[key] = pygame.mask.from_surface(image)
+    return mask
+
+
+_outlines = {}
+
+
+def get_mask_outline(mask: pygame.mask.Mask, color: tuple):
+    """
+        Function returns outline of pixel mask for dev info, it is traced once for every cached mask and color
+        :param mask: pygame Mask of model
+        :param color: color of outline
+        :return: surface of sprite size with the outline, other pixels are transparent by color key
+        """
+    key = (id(mask), color)
+    outline = _outlines.get(key)
+    if outline is None:
+        outline = _outlines[key] = pygame.Surface(mask.get_size())
+        # run-length encoded color key blits only the outline pixels
+        transparent = WHITE if color != WHITE else BLACK
+        outline.fill(transparent)
+        points = mask.outline()
+        if len(points) > 1:
+            pygame.draw.lines(outline, color, True, points)
+        outline.set_colorkey(transparent, pygame.RLEACCEL)
+    return outline
+
+
+def draw_collision_shape(screen: pygame.surface, color: tuple, collision_object, pixel_collision: bool):
+    """
+    Function draws the shape which collides: outline of pixel mask or hitbox
+    :param screen: screen created with pygame surface for run process
+    :param color: color of the shape
+    :param collision_object: Car, RoadObject or EntityView
+    :param pixel_collision: bool value, whether collisions test pixel masks
+    """
+    if not pixel_collision:
+        pygame.draw.rect(screen, color, collision_object.hitbox, 1)
+        return
+    screen.blit(get_mask_outline(collision_object.mask, color), collision_object.rect)
+
+
+_model_specs = {}
+
+
+def get_model_spec(model_path: str, rotation: int = 0, k_hitbox: float = K_HITBOX):
+    """
+        Function returns sprite and hitbox sizes of model, they are computed once for every model
+        :param model_path: path to model image
+        :param rotation: rotation angle of model in degrees
+        :param k_hitbox: ratio of hitbox size to sprite size
+        :return: ModelSpec of model
+        """
+    key = (model_path, rotation, k_hitbox)
+    spec = _model_specs.get(key)
+    if spec is None:
+        frames = get_animation(model_path, rotation).frames
+        spec = _model_specs[key] = ModelSpec(len(_model_specs), frames[0], k_hitbox, frames,
+                                             get_model_mask(model_path, rotation))
+    return spec
+
+
+def model_table():
+    """
+        Function describes models of road objects for telemetry clients
+        :return: dict of model id and [name of model, rotation]
+        """
+    return {spec.id: [os.path.splitext(os.path.basename(model_path))[0].lower(), rotation]
+            for (model_path, rotation, _), spec in _model_specs.items()}
 
 
 class RoadObject:
     def __init__(self, screen: pygame.surface, model_path: str, ob_centerx: int = (DP_WIDTH // 2),
-                 ob_bottom: int = DP_HEIGHT, ob_rotate: bool = False):
+                 ob_bottom: int = DP_HEIGHT, ob_rotate: bool = False, k_hitbox: float = K_HITBOX):
         """
         Creation of road objects. Base Class
         :param screen: screen created with pygame surface for run process
@@ -84,15 +401,15 @@ class RoadObject:
         :param ob_centerx: x-coordinate found by dividing the screen size by two
         :param ob_bottom: last y-coordinate of screen size
         :param ob_rotate: bool which is responsible for models rotation
+        :param k_hitbox: ratio of hitbox size to model size
         """
         self.screen = screen
         self.ob_rotate = ob_rotate
-        image = get_model_right_image(model_path)
-        self.image = pygame.transform.rotate(image, 180 * self.ob_rotate)
+        self.image = get_model_right_image(model_path, 180 * self.ob_rotate)
+        self.mask = get_model_mask(model_path, 180 * self.ob_rotate)
         self.rect = self.image.get_rect(centerx=ob_centerx, bottom=ob_bottom)
-        self.hitbox = pygame.transform.scale(self.image,
-                                             (self.rect.width * K_HITBOX, self.rect.height * K_HITBOX)).get_rect(
-            centerx=self.rect.centerx, centery=self.rect.centery)
+        self.hitbox = pygame.Rect(0, 0, int(self.rect.width * k_hitbox), int(self.rect.height * k_hitbox))
+        self.hitbox.center = self.rect.center
 
     def draw(self):
         """
@@ -107,69 +424,130 @@ class RoadObject:
         :param collision_object: checked object
         :return: bool result of collision check
         """
-        return self.hitbox.colliderect(collision_object.hitbox)
+        if not PIXEL_COLLISION:
+            return self.hitbox.colliderect(collision_object.hitbox)
+        other = collision_object.rect
+        if not self.rect.colliderect(other):
+            return False
+        return self.mask.overlap(collision_object.mask, (other.x - self.rect.x, other.y - self.rect.y)) is not None
+
+
+# plain ints of movement keys, bit tests on IntFlag create a new flag object each time
+_LEFT, _RIGHT, _UP, _DOWN = int(Keys.LEFT), int(Keys.RIGHT), int(Keys.UP), int(Keys.DOWN)
 
 
 class Car(RoadObject):
     health = USER_CAR_HEALTH
     immortal = False
     immortal_time_start = 0
+    invulnerable_time = USER_CAR_INVULNERABLE_TIME
+    prev_pos = None
 
-    def move(self):
+    def draw(self, alpha: float = 1.0):
+        """
+        Rendering function of user car.
+        :param alpha: position between previous and current simulation step, 0..1
+        :return: draw model on screen
+        """
+        self.screen.blit(self.image, self.position(alpha))
+
+    def position(self, alpha: float = 1.0):
+        """
+        :param alpha: position between previous and current simulation step, 0..1
+        :return: top left corner of user car drawn between simulation steps
+        """
+        if alpha >= 1 or self.prev_pos is None:
+            return self.rect.topleft
+        x, y = self.prev_pos
+        return round(x + (self.rect.x - x) * alpha), round(y + (self.rect.y - y) * alpha)
+
+    def move(self, keys: Keys = Keys.NONE):
         """
         Motion function of User Car.
+        :param keys: pressed control keys
         :return: new coordinates of user car
         """
         speed = DP_HEIGHT * 0.015
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_LEFT]:
+        self.prev_pos = self.rect.topleft
+        keys = int(keys)
+        # horizontal and vertical keys are independent, so diagonal input moves along both axes
+        if keys & _LEFT:
             if self.rect.x > DP_HEIGHT / 5 + DP_DELTA:
                 self.rect.x -= speed
-        elif keys[pygame.K_RIGHT]:
+        if keys & _RIGHT:
             if self.rect.x < DP_HEIGHT - (DP_HEIGHT / 5) - self.rect.width + DP_DELTA:
                 self.rect.x += speed
-        elif keys[pygame.K_UP]:
+        if keys & _UP:
             if self.rect.y > 0:
                 self.rect.y -= speed
-        elif keys[pygame.K_DOWN]:
+        if keys & _DOWN:
             if self.rect.y < DP_HEIGHT - self.rect.height:
                 self.rect.y += speed
 
         self.hitbox.centerx = self.rect.centerx
         self.hitbox.centery = self.rect.centery
 
-    def make_immortal(self, time: int, frame: int):
+    def reset(self):
+        """
+        Returns user car to the start position with full health.
+        """
+        self.image = get_model_right_image(CAR_PATH)
+        self.mask = get_model_mask(CAR_PATH)
+        self.rect.centerx = DP_WIDTH // 2
+        self.rect.bottom = DP_HEIGHT
+        self.hitbox.center = self.rect.center
+        self.prev_pos = None
+        self.health = USER_CAR_HEALTH
+        self.immortal = False
+        self.immortal_time_start = 0
+
+    def make_immortal(self, time: float):
         """
         Function makes user car immortal for a few seconds after user lost health
         :param time: Stopwatch
-        :param frame: current frame
         """
         if self.immortal and self.health > 0:
-            if int(time - self.immortal_time_start) != USER_CAR_INVULNERABLE_TIME:
-                self.image = get_model_right_image(CAR_SPIRIT_PATH) if frame % 6 in (
-                0, 1, 2) else get_model_right_image(
-                    CAR_PATH)
+            blink = get_blink_animation(CAR_PATH, CAR_SPIRIT_PATH)
+            if int(time - self.immortal_time_start) != self.invulnerable_time:
+                self.image = blink.frame(time)
             else:
-                self.image = get_model_right_image(CAR_PATH)
+                self.image = blink.frames[-1]
                 self.immortal = False
 
 
 class RoadObjects(ABC):
-    def __init__(self, screen: pygame.surface):
+    def __init__(self, screen: pygame.surface, rng: random.Random = None, k_hitbox: float = K_HITBOX,
+                 pixel_collision: bool = PIXEL_COLLISION):
         """
         Initialization of road objects. Base class func.
-        :param screen: screen created with pygame surface for run process
+        :param screen: screen created with pygame surface for run process, None for headless run
+        :param rng: random generator used for spawns
+        :param k_hitbox: ratio of hitbox size to model size
+        :param pixel_collision: bool value, whether collisions test pixel masks instead of hitboxes
         """
         self.screen = screen
-        self.list = []
+        self.rng = rng if rng is not None else random.Random()
+        self.k_hitbox = k_hitbox
+        self.pixel_collision = pixel_collision
+        self.store = EntityStore(ENTITY_POOL_SIZE)
+        for model_path, rotate in self.models():
+            self.store.reserve(get_model_spec(model_path, 180 * rotate, k_hitbox), POOL_SIZE_PER_MODEL)
+
+    @property
+    def list(self):
+        """
+        Road objects in spawn order. Views are built on each call, hot paths work with store directly.
+        :return: list of EntityView
+        """
+        return [EntityView(self.store, slot) for slot in self.store.active().tolist()]
 
-    def draw(self):
+    def draw(self, alpha: float = 1.0):
         """
         Rendering function of objects. Base class func.
+        :param alpha: position between previous and current simulation step, 0..1
         :return: objects on screen
         """
-        for item in self.list:
-            item.draw()
+        self.screen.blits(self.store.blit_items(alpha), doreturn=False)
 
     def move(self, speed: int):
         """
@@ -177,19 +555,59 @@ class RoadObjects(ABC):
         Function move objects on screen and delete them when they played their part
         :param speed: speed of movement on the screen
         """
-        for item in self.list:
-            item.rect.centery += speed
-            item.hitbox.centery = item.rect.centery
+        self.store.save_positions()
+        self.store.move(speed)
         self._check_object_delete()
 
+    def animate(self, time: float):
+        """
+        Advances animations of objects, images change only when the next frame is due.
+        :param time: stopwatch
+        """
+        tick = int(time * ANIMATION_FPS + 1e-6)
+        if tick != self.store.tick:
+            self.store.animate(tick)
+
+    def reset(self):
+        """
+        Removes all objects from the road.
+        """
+        self.store.clear()
+
+    def _collide(self, collision_object: Car):
+        """
+        :param collision_object: checked object - user car
+        :return: list of slots of objects which collide with it
+        """
+        if self.pixel_collision:
+            return self.store.collide_masks(collision_object.rect, collision_object.mask)
+        return self.store.collide(collision_object.hitbox)
+
     def _check_object_delete(self):
         """
         Func which is responsible for removal of road objects.
         :return:
         """
-        for item in self.list:
-            if item.rect.y > DP_HEIGHT:
-                self.list.remove(item)
+        self.store.cull(DP_HEIGHT)
+
+    def _spawn(self, model_path: str, line: int, rotate: bool):
+        """
+        Places new object from the model at the top of the road line.
+        :param model_path: path to image of object model
+        :param line: position of road line in percent of road width
+        :param rotate: bool which is responsible for model rotation
+        """
+        road_line = DP_HEIGHT * (line / 100) + DP_DELTA
+        self.store.spawn(get_model_spec(model_path, 180 * rotate, self.k_hitbox), road_line, -120,
+                         (line - 28) // 15, int(rotate))
+
+    @abstractmethod
+    def models(self):
+        """
+        Abstract method which lists models of objects
+        :return: list of (model path, rotation) pairs
+        """
+        ...
 
     @abstractmethod
     def collision_action(self, collision_object: Car, time: int):
@@ -209,17 +627,20 @@ class RoadObjects(ABC):
 
 
 class Enemies(RoadObjects):
+    def models(self):
+        """
+        Method which lists models of enemies, cars on the left lines drive towards user car
+        :return: list of (model path, rotation) pairs
+        """
+        return [(model_path, rotate) for model_path in CARS_PATH for rotate in (True, False)]
+
     def move(self, speed: int):
         """
         Method responsible for movement of enemies on the road
         :param speed: speed of background
         """
-        for item in self.list:
-            if item.ob_rotate:
-                item.rect.centery += round(speed * 1.25)
-            else:
-                item.rect.centery += round(speed * 0.75)
-            item.hitbox.centery = item.rect.centery
+        self.store.save_positions()
+        self.store.move(np.where(self.store.direction, round(speed * 1.25), round(speed * 0.75)))
         self._check_object_delete()
 
     def generate(self):
@@ -227,61 +648,56 @@ class Enemies(RoadObjects):
         Method which generates enemies on the road
         :return: new objects
         """
-        random.seed(tm.time())
-        if len(self.list) == 0 or self.list[-1].rect.y > random.randint(DP_HEIGHT // (-45), DP_HEIGHT // 9):
-            car_model = CARS_PATH[random.randrange(0, len(CARS_PATH))]
-            road_line = DP_HEIGHT * (random.randrange(28, 74, 15) / 100) + DP_DELTA
-            if road_line < DP_WIDTH / 2:
-                self.list.append(RoadObject(self.screen, car_model, road_line, -120, True))
-            else:
-                self.list.append(RoadObject(self.screen, car_model, road_line, -120, False))
+        newest = self.store.newest
+        if newest < 0 or self.store.y[newest] > self.rng.randint(DP_HEIGHT // (-45), DP_HEIGHT // 9):
+            car_model = CARS_PATH[self.rng.randrange(0, len(CARS_PATH))]
+            line = self.rng.randrange(28, 74, 15)
+            self._spawn(car_model, line, DP_HEIGHT * (line / 100) + DP_DELTA < DP_WIDTH / 2)
 
     def collision_action(self, collision_object: Car, time: float):
         """
         Method responsible for tracking the collision
         :param collision_object: checked object - user car
         :param time: stopwatch
-        :return: action of objects collision
+        :return: True when user car is destroyed
         """
+        if collision_object.immortal or not self._collide(collision_object):
+            return False
 
-        for item in self.list:
-            if not item.check_collision(collision_object):
-                continue
-
-            if collision_object.immortal:
-                continue
-
-            if collision_object.health > 1:
-                collision_object.health -= 1
-                collision_object.immortal = True
-                collision_object.immortal_time_start = time
-            else:
-                end_screen(self.screen)
-
-    # def collision(self, collision_object: Car, time: float):
-    #     for item in self.list:
-    #         if item.hitbox.colliderect(collision_object.hitbox) and not collision_object.immortal:
-    #             if collision_object.health > 1:
-    #                 collision_object.health -= 1
-    #                 collision_object.immortal = True
-    #                 collision_object.immortal_time_start = time
-    #             elif collision_object.health == 1:
-    #                 end_screen(self.screen)
+        if collision_object.health > 1:
+            collision_object.health -= 1
+            collision_object.immortal = True
+            collision_object.immortal_time_start = time
+            return False
+        return True
 
 
 class Coins(RoadObjects):
     count = 0
 
+    def models(self):
+        """
+        Method which lists models of coins
+        :return: list of (model path, rotation) pairs
+        """
+        return [(COIN_PATH, False)]
+
+    def reset(self):
+        """
+        Removes all coins from the road and resets collected coins.
+        """
+        super().reset()
+        self.count = 0
+
     def generate(self):
         """
         Method which generates coins on the road
         :return: new coins
         """
-        random.seed(tm.time())
-        if len(self.list) == 0 or self.list[-1].rect.y > DP_HEIGHT // 2:
+        newest = self.store.newest
+        if newest < 0 or self.store.y[newest] > DP_HEIGHT // 2:
             coin_model = COIN_PATH
-            road_line = DP_HEIGHT * (random.randrange(28, 74, 15) / 100) + DP_DELTA
-            self.list.append(RoadObject(self.screen, coin_model, road_line, -120))
+            self._spawn(coin_model, self.rng.randrange(28, 74, 15), False)
 
     def collision_action(self, collision_object: Car, time: int):
         """
@@ -290,154 +706,100 @@ class Coins(RoadObjects):
         :param time: stopwatch
         :return: action of objects collision
         """
-        for item in self.list:
-            if item.check_collision(collision_object):
-                self.count += 1
-                self.list.remove(item)
+        collected = self._collide(collision_object)
+        if collected:
+            self.count += len(collected)
+            self.store.kill(collected)
 
 
-def start_screen(screen: pygame.surface, background_path: str):
+class GameState(Enum):
     """
-    Method that creates start menu for user
-    :param screen: screen created with pygame surface for run process
-    :param background_path: path to image of background
-    :return: start menu
-
+    Screens of the game, main loop switches between them
     """
-    running = True
+    START = "start"
+    PLAYING = "playing"
+    PAUSED = "paused"
+    GAME_OVER = "game_over"
+    EXIT = "exit"
 
-    while running:
-        screen.fill(GRAY)
-        image = get_background_right_image(background_path)
-        image_rect = image.get_rect(y=0, centerx=DP_WIDTH // 2)
-        screen.blit(image, image_rect)
 
-        button_image = pygame.image.load(BUTTON_PATH)
-        k_button_widht = button_image.get_rect().width / button_image.get_rect().height
-        button_image = pygame.transform.scale(pygame.image.load(BUTTON_PATH),
-                                              ((DP_WIDTH // 10) * k_button_widht, DP_HEIGHT // 10))
+_menus = {}
 
-        button_start = screen.blit(button_image, button_image.get_rect(centerx=DP_WIDTH // 2, bottom=DP_HEIGHT / 2.5))
-        button_exit = screen.blit(button_image, button_image.get_rect(centerx=DP_WIDTH // 2, bottom=DP_HEIGHT / 1.8))
 
-        font_object = pygame.font.Font(pygame.font.get_default_font(), 15)
-
-        button_start_text = font_object.render("Start", True, WHITE)
-        bst_rect = button_start_text.get_rect(centerx=button_start.centerx, centery=button_start.centery)
-        button_exit_text = font_object.render("Exit", True, WHITE)
-        bet_rect = button_exit_text.get_rect(centerx=button_exit.centerx, centery=button_exit.centery)
+def _get_menu(name: str, screen: pygame.surface, build):
+    """
+    Returns menu built once for the screen
+    :param name: name of menu
+    :param screen: screen created with pygame surface for run process
+    :param build: function which creates the menu
+    :return: Menu
+    """
+    menu = _menus.get(name)
+    if menu is None or menu.screen is not screen:
+        menu = _menus[name] = build()
+    return menu
 
-        screen.blit(button_start_text, bst_rect)
-        screen.blit(button_exit_text, bet_rect)
 
-        pygame.display.update()
+def start_screen(screen: pygame.surface, background_path: str):
+    """
+    Method that creates start menu for user
+    :param screen: screen created with pygame surface for run process
+    :param background_path: path to image of background
+    :return: next state of the game
 
-        for event in pygame.event.get():
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_F2:
-                    running = False
-            elif button_start.collidepoint(pygame.mouse.get_pos()):
-                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                    running = False
-            elif button_exit.collidepoint(pygame.mouse.get_pos()):
-                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                    quit()
+    """
+    menu = _get_menu("start", screen, lambda: Menu(
+        screen,
+        [Button("Start", "start", DP_WIDTH // 2, DP_HEIGHT / 2.5),
+         Button("Exit", "exit", DP_WIDTH // 2, DP_HEIGHT / 1.8)],
+        {pygame.K_F2: "start"}, get_background_right_image(background_path)))
 
-            if event.type == pygame.QUIT:
-                quit()
+    if menu.run() == "exit":
+        return GameState.EXIT
+    return GameState.PLAYING
 
 
 def pause_screen(screen: pygame.surface):
     """
     Method that shows the pause menu to the user
     :param screen: screen created with pygame surface for run process
-    :return: pause menu on screen
+    :return: next state of the game
     """
-    running = True
-
-    while running:
-        button_image = pygame.image.load(BUTTON_PATH)
-        k_button_widht = button_image.get_rect().width / button_image.get_rect().height
-        button_image = pygame.transform.scale(pygame.image.load(BUTTON_PATH),
-                                              ((DP_WIDTH // 10) * k_button_widht, DP_HEIGHT // 10))
-
-        button_resume = screen.blit(button_image, button_image.get_rect(centerx=DP_WIDTH // 2, bottom=DP_HEIGHT / 2.5))
-        button_exit = screen.blit(button_image, button_image.get_rect(centerx=DP_WIDTH // 2, bottom=DP_HEIGHT / 1.8))
-
-        font_object = pygame.font.Font(pygame.font.get_default_font(), 15)
-
-        button_resume_text = font_object.render("Resume", True, WHITE)
-        brt_rect = button_resume_text.get_rect(centerx=button_resume.centerx, centery=button_resume.centery)
-        button_exit_text = font_object.render("Exit", True, WHITE)
-        bet_rect = button_exit_text.get_rect(centerx=button_exit.centerx, centery=button_exit.centery)
+    menu = _get_menu("pause", screen, lambda: Menu(
+        screen,
+        [Button("Resume", "resume", DP_WIDTH // 2, DP_HEIGHT / 2.5),
+         Button("Exit", "exit", DP_WIDTH // 2, DP_HEIGHT / 1.8)],
+        {pygame.K_ESCAPE: "resume"}))
 
-        screen.blit(button_resume_text, brt_rect)
-        screen.blit(button_exit_text, bet_rect)
-
-        pygame.display.update()
-
-        for event in pygame.event.get():
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    running = False
-            elif button_resume.collidepoint(pygame.mouse.get_pos()):
-                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                    running = False
-            elif button_exit.collidepoint(pygame.mouse.get_pos()):
-                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                    quit()
-
-            if event.type == pygame.QUIT:
-                quit()
+    if menu.run() == "exit":
+        return GameState.EXIT
+    return GameState.PLAYING
 
 
 def end_screen(screen: pygame.surface):
     """
     Method that shows the end screen to the user
     :param screen: screen created with pygame surface for run process
-    :return: end screen
-    """
-    running = True
-
-    while running:
-        button_image = pygame.image.load(BUTTON_PATH)
-        k_button_widht = button_image.get_rect().width / button_image.get_rect().height
-        button_image = pygame.transform.scale(pygame.image.load(BUTTON_PATH),
-                                              ((DP_WIDTH // 10) * k_button_widht, DP_HEIGHT // 10))
-
-        button_restart = screen.blit(button_image, button_image.get_rect(centerx=DP_WIDTH // 2, bottom=DP_HEIGHT / 2.5))
-        button_exit = screen.blit(button_image, button_image.get_rect(centerx=DP_WIDTH // 2, bottom=DP_HEIGHT / 1.8))
-
-        font_object = pygame.font.Font(pygame.font.get_default_font(), 15)
-
-        button_restart_text = font_object.render("Restart", True, WHITE)
-        brst_rect = button_restart_text.get_rect(centerx=button_restart.centerx, centery=button_restart.centery)
-        button_exit_text = font_object.render("Exit", True, WHITE)
-        bet_rect = button_exit_text.get_rect(centerx=button_exit.centerx, centery=button_exit.centery)
-
-        screen.blit(button_restart_text, brst_rect)
-        screen.blit(button_exit_text, bet_rect)
-
-        pygame.display.update()
-        global SCORE, PREVIOUS_SCORE, BEST_SCORE
-        for event in pygame.event.get():
-            if button_restart.collidepoint(pygame.mouse.get_pos()):
-                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                    PREVIOUS_SCORE = SCORE
-                    if PREVIOUS_SCORE > BEST_SCORE:
-                        BEST_SCORE = PREVIOUS_SCORE
-                    SCORE = 0
-                    magic()
-            if button_exit.collidepoint(pygame.mouse.get_pos()):
-                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                    quit()
+    :return: next state of the game
+    """
+    menu = _get_menu("end", screen, lambda: Menu(
+        screen,
+        [Button("Restart", "restart", DP_WIDTH // 2, DP_HEIGHT / 2.5),
+         Button("Exit", "exit", DP_WIDTH // 2, DP_HEIGHT / 1.8)]))
+
+    if menu.run() == "exit":
+        return GameState.EXIT
+    return GameState.PLAYING
 
-            if event.type == pygame.QUIT:
-                quit()
+
+# dev info blocks under frame timings start below the table with a row for every phase, the budget bar
+# and the updated pixels line
+PROFILE_TOP = 210
+PROFILE_BOTTOM = PROFILE_TOP + 18 * (len(PHASES) + 1) + 25 + 22 + 18
 
 
 def show_dev_info(show: bool, screen: pygame.surface, time: float, user_car: Car, background: Background, enemies,
-                  coins, frame: int):
+                  coins, frame: int, enemy_labels: bool = True):
     """
     Method that shows additional developer info to the player
     :param show: bool value
@@ -448,34 +810,38 @@ def show_dev_info(show: bool, screen: pygame.surface, time: float, user_car: Car
     :param enemies: enemies objects
     :param coins: coins objects
     :param frame: int value - current frame
+    :param enemy_labels: bool value, whether collision shapes and positions of enemies are shown
     :return: dev info
     """
     if show:
-        font_object = pygame.font.Font(pygame.font.get_default_font(), 15)
-
-        screen.blit(font_object.render(f"Time: {time}", True, BLACK), (10, 10))
+        draw_value(screen, "Time: ", time, BLACK, 15, (10, 10))
         screen.blit(
-            font_object.render(f"Speed: {background.speed}, Max: {background.speed % background.max_speed == 0}", True,
-                               BLACK), (10, 30))
-        screen.blit(font_object.render(f"User car pos: {[user_car.rect.x, user_car.rect.y]}", True, BLACK),
-                    (10, 50))
-        screen.blit(font_object.render(f"Background Y: {background.rect.y}", True, RED), (10, 70))
-        screen.blit(font_object.render(f"Enemies count: {len(enemies.list)}", True, BLACK), (10, 100))
-        screen.blit(font_object.render(f"Coins count: {len(coins.list)}", True, BLACK), (10, 120))
-        screen.blit(font_object.render(f"Player health: {user_car.health}", True, BLACK), (10, 140))
-        screen.blit(font_object.render(f"Player damage taken: {user_car.immortal}", True, BLACK), (10, 160))
+            text_cache.render(f"Speed: {background.speed}, Max: {background.speed % background.max_speed == 0}",
+                              BLACK, 15), (10, 30))
+        draw_value(screen, "User car pos: ", [user_car.rect.x, user_car.rect.y], BLACK, 15, (10, 50))
+        draw_value(screen, "Background Y: ", background.rect.y, RED, 15, (10, 70))
+        screen.blit(text_cache.render(f"Enemies count: {len(enemies.store)}", BLACK, 15), (10, 100))
+        screen.blit(text_cache.render(f"Coins count: {len(coins.store)}", BLACK, 15), (10, 120))
+        draw_values(screen, [("Collision tests broad/narrow: enemies ",
+                              f"{enemies.store.broad_hits}/{enemies.store.narrow_hits}"),
+                             (", coins ", f"{coins.store.broad_hits}/{coins.store.narrow_hits}")],
+                    BLACK, 15, (10, PROFILE_BOTTOM + 90))
+        screen.blit(text_cache.render(f"Player health: {user_car.health}", BLACK, 15), (10, 140))
+        screen.blit(text_cache.render(f"Player damage taken: {user_car.immortal}", BLACK, 15), (10, 160))
 
         if frame % (240 / background.speed) == 0:
-            screen.blit(font_object.render(f"Frame: {frame}", True, RED), (10, 180))
+            draw_value(screen, "Frame: ", frame, RED, 15, (10, 180))
         else:
-            screen.blit(font_object.render(f"Frame: {frame}", True, BLACK), (10, 180))
+            draw_value(screen, "Frame: ", frame, BLACK, 15, (10, 180))
 
-        for car in enemies.list:
-            pygame.draw.rect(screen, BLACK, car.hitbox, 1)
-            screen.blit(font_object.render(f"{car.rect.y}", True, WHITE),
-                        (car.rect.centerx, car.rect.centery))
+        if enemy_labels:
+            labels = get_atlas(15, WHITE)
+            for car in enemies.list:
+                rect = car.rect
+                draw_collision_shape(screen, BLACK, car, enemies.pixel_collision)
+                labels.draw(screen, str(rect.y), rect.center)
 
-        pygame.draw.rect(screen, RED, user_car.hitbox, 1)
+        draw_collision_shape(screen, RED, user_car, enemies.pixel_collision)
 
 
 def show_player_info(show: bool, screen: pygame.surface, time: int, coins: Coins, user_car: Car, score,
@@ -498,20 +864,18 @@ def show_player_info(show: bool, screen: pygame.surface, time: int, coins: Coins
     sz = int(DP_HEIGHT / 40)
 
     if not show:
-        font_object = pygame.font.Font(pygame.font.get_default_font(), sz)
         # screen.blit(font_object.render(f"Time: {int(time)}", True, BLACK), (DP_WIDTH/45, DP_HEIGHT//90))
-        screen.blit(font_object.render(f"Coins: {coins.count}", True, BLACK), (x, y1))
-        screen.blit(font_object.render(f"Health: {user_car.health}", True, RED), (x, y2))
-        screen.blit(font_object.render(f"Score: {int(score)}", True, GREEN), (x, y3))
+        screen.blit(text_cache.render(f"Coins: {coins.count}", BLACK, sz), (x, y1))
+        screen.blit(text_cache.render(f"Health: {user_car.health}", RED, sz), (x, y2))
+        screen.blit(text_cache.render(f"Score: {int(score)}", GREEN, sz), (x, y3))
 
 
-def show_score_info(show: bool, screen: pygame.surface, previous_score, best_score, background: Background):
+def show_score_info(show: bool, screen: pygame.surface, scores, background: Background):
     """
     Method that shows to the player additional info about score
     :param show: bool value
     :param screen:  screen created with pygame surface for run process
-    :param previous_score: int value - last score of player
-    :param best_score: int value - best score of player
+    :param scores: ScoreStore with last and best scores of player, None when scores are not shown
     :param background: created Background
     :return: score info
     """
@@ -520,71 +884,335 @@ def show_score_info(show: bool, screen: pygame.surface, previous_score, best_sco
     y2 = DP_HEIGHT - 9 * (DP_HEIGHT / 10)
     # y3 = DP_HEIGHT - 8.5 * (DP_HEIGHT / 10)
     sz = int(DP_HEIGHT / 40)
-    if not show:
-        font_object = pygame.font.Font(pygame.font.get_default_font(), sz)
+    if not show and scores is not None:
         # screen.blit(font_object.render(f"Score: {int(score)}", True, GREEN), (x, DP_HEIGHT//90))
-        screen.blit(font_object.render(f"Previous score: {int(previous_score)}", True, BLACK), (x, y1))
-        screen.blit(font_object.render(f"Best score: {int(best_score)}", True, BLUE), (x, y2))
+        screen.blit(text_cache.render(f"Previous score: {int(scores.previous)}", BLACK, sz), (x, y1))
+        screen.blit(text_cache.render(f"Best score: {int(scores.best)}", BLUE, sz), (x, y2))
         # screen.blit(font_object.render(f"Score: {}", True, BLACK), (DP_WIDTH/45, DP_HEIGHT//9))
 
 
-def magic():
+def show_frame_profile(show: bool, screen: pygame.surface, profiler):
     """
-    Main method.
-    Method that collects all methods in itself.
-    :return: game process
+    Method that shows timings of frame phases next to developer info
+    :param show: bool value
+    :param screen: screen created with pygame surface for run process
+    :param profiler: FrameProfiler of the game
+    :return: p50/p95/p99 of every phase, frame budget bar and share of screen pushed to display,
+             frames with developer info are full repaints
+    """
+    if not show or not isinstance(profiler, FrameProfiler):
+        return
+
+    colors = [(230, 25, 75), (245, 130, 48), (255, 225, 25), (60, 180, 75), (0, 130, 200), (145, 30, 180),
+              (70, 240, 240), (240, 50, 230), (128, 128, 0), (170, 110, 40)]
+    budget = 1000 / FPS
+    summary = profiler.summary()
+    x, y = 10, PROFILE_TOP
+    screen.blit(text_cache.render("phase         p50 / p95 / p99 ms", BLACK, 15), (x, y))
+    for i, phase in enumerate(PHASES + ("total",)):
+        y += 18
+        color = colors[i] if i < len(colors) else BLACK
+        pygame.draw.rect(screen, color, (x, y + 3, 10, 10))
+        screen.blit(text_cache.render(phase, BLACK, 15), (x + 15, y))
+        get_atlas(15, BLACK).draw(screen, f"{summary[0, i]:.2f} {summary[1, i]:.2f} {summary[2, i]:.2f}",
+                                  (x + 130, y))
+
+    # median of every phase stacked on a bar, which full width is the frame budget
+    y += 25
+    width = 300
+    pygame.draw.rect(screen, WHITE, (x, y, width, 14))
+    left = x
+    for i in range(len(PHASES)):
+        part = int(width * summary[0, i] / budget)
+        pygame.draw.rect(screen, colors[i], (left, y, part, 14))
+        left += part
+    for percentile, color in ((1, BLUE), (2, RED)):
+        marker = x + min(int(width * summary[percentile, -1] / budget), width + 20)
+        pygame.draw.line(screen, color, (marker, y - 3), (marker, y + 16), 2)
+    pygame.draw.rect(screen, BLACK, (x, y, width, 14), 1)
+
+    pixels = profiler.pixel_summary()
+    draw_value(screen, "Updated pixels % p50 / p95 / p99: ", f"{pixels[0]:.0f} {pixels[1]:.0f} {pixels[2]:.0f}",
+               BLACK, 15, (x, y + 22))
+
+
+def show_input_info(show: bool, screen: pygame.surface, profiler):
+    """
+    Method that shows time from input to its presentation on screen under frame timings
+    :param show: bool value
+    :param screen: screen created with pygame surface for run process
+    :param profiler: FrameProfiler of the game
     """
-    screen = pygame.display.set_mode((DP_WIDTH, DP_HEIGHT))
-    clock = pygame.time.Clock()
+    if not show or not isinstance(profiler, FrameProfiler):
+        return
+    p50, p95, p99, count = profiler.latency_summary()
+    draw_values(screen, [("Input latency upper bound ms: ", f"{p50:.1f} {p95:.1f} {p99:.1f}"), (", inputs ", count)],
+                BLACK, 15, (10, PROFILE_BOTTOM + 60))
 
-    background = Background(screen)
-    user_car = Car(screen, CAR_PATH)
-    enemies = Enemies(screen)
-    coins = Coins(screen)
 
-    frame_count = 0
+def show_memory_info(show: bool, screen: pygame.surface, memory):
+    """
+    Method that shows the last memory sample beside the road
+    :param show: bool value
+    :param screen: screen created with pygame surface for run process
+    :param memory: MemoryMonitor of the game, None when memory is not sampled
+    """
+    if not show or memory is None:
+        return
+    x, y = DP_DELTA + DP_HEIGHT + 10, 150
+    sample = memory.last
+    if sample is None:
+        screen.blit(text_cache.render(f"Memory: first sample in {memory.interval} s", BLACK, 15), (x, y))
+        return
+    counts = sample["subsystems"]
+    if sample["rss_mb"] is not None:
+        rss = [(" s: rss ", f"{sample['rss_mb']:.1f}"), (" MB (", f"{sample['rss_growth_mb']:+.1f}"), (")", None)]
+    else:
+        rss = [(" s: rss ?", None)]
+    # labels are cached text, numbers change with every sample and are drawn with glyph atlas
+    lines = [
+        [("Memory at ", f"{sample['uptime_s']:.0f}")] + rss,
+        [("Traced ", f"{sample['traced_mb']:.1f}"), (" MB (", f"{sample['traced_growth_mb']:+.1f}"),
+         ("), sample ", f"{sample['sample_ms']:.0f}"), (" ms", None)],
+        [("Live surfaces ", sample["live"]["surfaces"]), (", fonts ", sample["live"]["fonts"])] if sample["live"] else
+        [("Live surfaces and fonts: --memory-census", None)],
+        [("Sprites ", counts["sprites"]), (", text ", counts["text"]), (", fonts ", counts["fonts"]),
+         (", atlases ", counts["glyph_atlases"])],
+        [("Enemies ", f"{counts['enemies']}/{counts['enemies_slots']}"),
+         (", coins ", f"{counts['coins']}/{counts['coins_slots']}")],
+        [("Growth since previous sample:", None)],
+    ] + [[(f"  {name} ", f"{size:+.1f}"), (" KB", None)] for name, size, _ in sample["functions"][:5]]
+    for parts in lines:
+        draw_values(screen, parts, BLACK, 15, (x, y))
+        y += 20
+
+
+def show_capture_info(show: bool, screen: pygame.surface, capture):
+    """
+    Method that shows frame capture counters under memory sample
+    :param show: bool value
+    :param screen: screen created with pygame surface for run process
+    :param capture: FrameCapture of the game, None when frames are not captured
+    """
+    if not show or capture is None:
+        return
+    x, y = DP_DELTA + DP_HEIGHT + 10, 400
+    summary = capture.summary()
+    lines = [
+        [("Capture: ", summary["written"]), (" written, ", summary["dropped"]),
+         (" dropped, ", f"{summary['mb']:.1f}"), (" MB", None)],
+        [("Main thread ms p50 / p99: ", f"{summary['main_ms'][0]:.2f} {summary['main_ms'][1]:.2f}")],
+        [("Main thread CPU ms: ", f"{summary['main_cpu_ms'][0]:.2f} {summary['main_cpu_ms'][1]:.2f}")],
+        [("Writer ms p50 / p99: ", f"{summary['encode_ms'][0]:.1f} {summary['encode_ms'][1]:.1f}")],
+    ]
+    for parts in lines:
+        draw_values(screen, parts, BLACK, 15, (x, y))
+        y += 20
+
+
+def show_quality_info(show: bool, screen: pygame.surface, quality):
+    """
+    Method that shows current quality level under frame timings
+    :param show: bool value
+    :param screen: screen created with pygame surface for run process
+    :param quality: QualityController of the game, None when quality is fixed
+    """
+    if not show or quality is None:
+        return
+    scale, enemy_labels, layers = quality.levels[quality.level]
+    screen.blit(text_cache.render(
+        f"Quality {quality.level}/{len(quality.levels) - 1}: scale {scale:.2f}, "
+        f"labels {'on' if enemy_labels else 'off'}, layers {'all' if layers else 'road'}", BLACK, 15),
+        (10, PROFILE_BOTTOM + 10))
+    draw_value(screen, "Frame average ms: ", f"{quality.average:.2f}", BLACK, 15, (10, PROFILE_BOTTOM + 30))
+
+
+class Session:
+    def __init__(self, screen: pygame.surface, replay=None):
+        """
+        Objects which live for the whole run of program and are reused by every game.
+        :param screen: screen created with pygame surface for run process
+        :param replay: Recording played instead of user input, None for normal game
+        """
+        from game_engine import Simulation
+        from game_render import Renderer, DirtyRenderer, ScaledRenderer, QualityController
+        from game_scores import ScoreStore
+        from game_telemetry import TelemetryServer
+        from game_memory import MemoryMonitor
+        from game_capture import FrameCapture
 
-    global SCORE
-    dev_info = False
-    running = True
-    while running:
+        self.screen = screen
+        self.clock = pygame.time.Clock()
+        self.profiler = FrameProfiler()
+        self.simulation = Simulation(seed=replay.seed if replay is not None else None, screen=screen,
+                                     profiler=self.profiler)
+        self.quality = None
+        if ADAPTIVE_QUALITY or RENDER_SCALE < 1:
+            self.renderer = ScaledRenderer(screen, self.profiler, RENDER_SCALE)
+            if ADAPTIVE_QUALITY:
+                self.quality = QualityController(self.renderer, self.simulation.background)
+        elif DIRTY_RECTS:
+            self.renderer = DirtyRenderer(screen, self.profiler)
+        else:
+            self.renderer = Renderer(screen, self.profiler)
+        self.renderer.quality = self.quality
+        self.dev_info = False
+        self.input = InputBuffer()
+        self.scores = ScoreStore(SCORES_PATH)
+        self.renderer.scores = self.scores
+        self.telemetry = TelemetryServer(TELEMETRY_ADDRESS, model_table()) if TELEMETRY_ADDRESS else None
+        self.memory = MemoryMonitor(MEMORY_OUT) if MEMORY_STATS else None
+        self.renderer.memory = self.memory
+        self.capture = FrameCapture(CAPTURE_PATH, screen) if CAPTURE_PATH else None
+        self.renderer.capture = self.capture
+
+        self.replay = replay
+        self.recording = None
+        self.games = 0
+        # ESC and F1 pressed since the last simulation step, they are logged with the next step
+        self.event_keys = Keys.NONE
+        self._start_recording()
+
+    def _start_recording(self):
+        """
+        Starts input log of the current game when recording is enabled.
+        """
+        if RECORD_PATH and self.replay is None:
+            from game_replay import Recording
 
-        clock.tick(FPS)
+            self.games += 1
+            self.recording = Recording(self.simulation.seed, USER_CAR_MODEL, USER_CAR_HEALTH)
 
-        frame_count += 1
-        second_count = frame_count / FPS
-        SCORE += 0.01 * background.speed
+    def save_recording(self):
+        """
+        Saves input log of the current game with its result.
+        :return: path of saved file, None when nothing is recorded
+        """
+        if self.recording is None or not len(self.recording):
+            return None
+        from game_replay import numbered_path
 
-        enemies.generate()
-        coins.generate()
+        file_path = numbered_path(RECORD_PATH, self.games)
+        self.recording.finish(self.simulation)
+        self.recording.save(file_path)
+        self.recording = None
+        return file_path
 
-        user_car.make_immortal(second_count, frame_count)
+    def step(self):
+        """
+        Advances simulation by one step with keys of user or of played recording.
+        :return: False when the game is over or the recording has ended
+        """
+        simulation = self.simulation
+        if self.replay is not None:
+            if simulation.frame_count >= len(self.replay):
+                return False
+            keys = Keys(self.replay[simulation.frame_count])
+            if keys & Keys.F1:
+                self.dev_info = not self.dev_info
+        else:
+            keys = self.input.sample() | self.event_keys
+            self.event_keys = Keys.NONE
+            if self.recording is not None:
+                self.recording.append(keys)
+        return simulation.step(keys)
 
-        background.move(second_count)
-        coins.move(background.speed)
-        enemies.move(background.speed)
-        user_car.move()
+    def save_score(self):
+        """
+        Adds finished game to score store, replays are not counted.
+        """
+        if self.replay is None:
+            simulation = self.simulation
+            self.scores.add(simulation.score, simulation.coins.count, simulation.frame_count, USER_CAR_MODEL)
 
-        screen.fill(GRAY)
-        background.draw()
-        coins.draw()
-        enemies.draw()
-        user_car.draw()
+    def close(self):
+        """
+        Saves input log of unfinished game, waits for scores to be written and disconnects spectators.
+        """
+        self.save_recording()
+        self.scores.close()
+        if self.telemetry is not None:
+            self.telemetry.close()
+        if self.memory is not None:
+            self.memory.close()
+        if self.capture is not None:
+            self.capture.close()
+
+    def restart(self):
+        """
+        Resets the game in place for the next run.
+        """
+        self.save_recording()
+        self.simulation.reset()
+        self.renderer.invalidate()
+        self._start_recording()
+
+
+def magic(session: Session):
+    """
+    Main method.
+    Method that renders the game simulation and handles user input until the game is paused or over.
+    When session plays a recording, keys are taken from it and the game is over when the recording ends.
+    Simulation advances with fixed steps of 1 / FPS seconds, frames are drawn with RENDER_FPS rate
+    and objects are interpolated between the last two simulation steps.
+    Events are pumped at the start of frame, before the steps which sample them.
+    :param session: Session with the game
+    :return: next state of the game
+    """
+    simulation = session.simulation
+    renderer = session.renderer
+    profiler = session.profiler
+    renderer.invalidate()
+    allow_events(GAME_EVENTS)
+    session.input.reset()
+
+    step_time = 1 / FPS
+    accumulator = step_time
+    session.clock.tick()
 
-        show_score_info(dev_info, screen, PREVIOUS_SCORE, BEST_SCORE, background)
-        show_dev_info(dev_info, screen, second_count, user_car, background, enemies, coins, frame_count)
-        show_player_info(dev_info, screen, second_count, coins, user_car, SCORE, background)
+    while True:
 
-        for event in pygame.event.get():
+        elapsed = session.clock.tick(RENDER_FPS) / 1000
+        profiler.begin_frame()
+
+        for event in session.input.poll():
             if event.type == pygame.QUIT:
-                quit()
+                return GameState.EXIT
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_F1:
-                    dev_info = not dev_info
+                    session.dev_info = not session.dev_info
+                    session.event_keys |= Keys.F1
                 if event.key == pygame.K_ESCAPE:
-                    pause_screen(screen)
-
-        pygame.display.update()
-
-        enemies.collision_action(user_car, second_count)
-        coins.collision_action(user_car, second_count)
\ No newline at end of file
+                    session.event_keys |= Keys.ESC
+                    return GameState.PAUSED
+        profiler.lap(EVENTS)
+
+        # after long hitch the game slows down instead of running many steps in a row
+        accumulator = min(accumulator + elapsed, MAX_FRAME_TIME)
+        alive = True
+        while accumulator >= step_time and alive:
+            alive = session.step()
+            accumulator -= step_time
+        if session.telemetry is not None:
+            # rest of the step loop is counted with the last phase of simulation step
+            profiler.lap(COLLISION)
+            session.telemetry.publish(simulation)
+            profiler.lap(TELEMETRY)
+
+        renderer.render(simulation, session.dev_info, accumulator / step_time if alive else 1.0)
+
+        renderer.present()
+        profiler.lap(DISPLAY)
+        profiler.updated_pixels(renderer.updated_pixels)
+        session.input.presented(profiler)
+        if session.capture is not None:
+            session.capture.add(session.screen, simulation.frame_count)
+            profiler.lap(CAPTURE)
+        frame_ms = profiler.end_frame()
+        if session.quality is not None:
+            session.quality.update(frame_ms)
+        if session.memory is not None:
+            session.memory.update(session)
+
+        if not alive:
+            return GameState.GAME_OVER
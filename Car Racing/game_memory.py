@@ -0,0 +1,251 @@
+import ast
+import gc
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import tracemalloc
+from time import perf_counter
+import pygame
+from game_config import MEMORY_INTERVAL, MEMORY_TRACE_FRAMES, MEMORY_WARN_MB, MEMORY_CENSUS
+
+logger = logging.getLogger(__name__)
+
+_CONTAINERS = (dict, list, tuple, set, frozenset)
+
+
+def live_objects(types: tuple):
+    """
+    Counts objects of the types referenced from Python objects. Surfaces and fonts are not tracked
+    by garbage collector, so they are found as referents of tracked objects and of untracked containers.
+    Takes a fraction of second, it is meant for periodic samples.
+    :param types: tuple of counted types
+    :return: dict of type and number of live objects
+    """
+    found = {kind: set() for kind in types}
+    visited = set()
+    referents = gc.get_referents(*gc.get_objects())
+    while referents:
+        nested = []
+        for obj in referents:
+            kind = type(obj)
+            if kind in found:
+                found[kind].add(id(obj))
+            elif kind in _CONTAINERS and not gc.is_tracked(obj) and id(obj) not in visited:
+                visited.add(id(obj))
+                nested.append(obj)
+        referents = gc.get_referents(*nested) if nested else None
+    return {kind: len(ids) for kind, ids in found.items()}
+
+
+def read_rss():
+    """
+    :return: resident set size of process in bytes, None on systems without /proc
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class FunctionIndex:
+    def __init__(self, file_path: str):
+        """
+        Maps lines of source file to names of functions which contain them.
+        :param file_path: path to Python source
+        """
+        self.file_path = file_path
+        self.functions = []
+        with open(file_path) as file:
+            self._visit(ast.parse(file.read()), "")
+        # the innermost function is found first
+        self.functions.sort(key=lambda function: function[1] - function[0])
+        self._names = {}
+
+    def _visit(self, node, prefix: str):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                name = prefix + child.name
+                if not isinstance(child, ast.ClassDef):
+                    self.functions.append((child.lineno, child.end_lineno, name))
+                self._visit(child, name + ".")
+
+    def name(self, line: int):
+        """
+        :param line: line number
+        :return: qualified name of function, "<module>" for module level code
+        """
+        name = self._names.get(line)
+        if name is None:
+            name = next((name for first, last, name in self.functions if first <= line <= last), "<module>")
+            self._names[line] = name
+        return name
+
+
+class MemoryMonitor:
+    def __init__(self, file_path: str = None, interval: float = MEMORY_INTERVAL, warn_mb: float = MEMORY_WARN_MB,
+                 frames: int = MEMORY_TRACE_FRAMES, census: bool = MEMORY_CENSUS):
+        """
+        Periodic memory samples of a long session: RSS, memory traced by tracemalloc, sizes of caches
+        and road object stores, and growth of allocations made by game_items.py functions since the previous
+        sample. Warning is logged every time growth since the first sample passes the next multiple of warn_mb.
+        Samples are taken by a background thread, game loop only wakes it up. Tracing slows the game down,
+        monitor is enabled by --memory-stats.
+        :param file_path: file which gets every sample as a JSON line, None - samples are only shown
+        :param interval: seconds between samples
+        :param warn_mb: growth in megabytes which is logged as warning
+        :param frames: depth of traced tracebacks, allocations in helpers are counted to their game_items caller
+        :param census: count live surfaces and fonts by walking all Python objects, it takes a fraction of second
+        """
+        import game_items
+
+        self.file_path = file_path
+        self.interval = interval
+        self.warn_mb = warn_mb
+        self.census = census
+        self.index = FunctionIndex(game_items.__file__)
+        self.samples = 0
+        self.last = None
+        self.sample_ms = 0.0
+        self._warned = 0
+        self._started = perf_counter()
+        self._next = self._started + interval
+        self._baseline = None
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._functions = self.function_totals(tracemalloc.take_snapshot())
+        self._queue = queue.Queue(1)
+        self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+        self._thread.start()
+
+    def update(self, session):
+        """
+        Wakes sampler thread when sample is due, called once a frame. Never waits for the sample.
+        :param session: Session of the game
+        """
+        if perf_counter() >= self._next:
+            self._next = perf_counter() + self.interval
+            try:
+                self._queue.put_nowait(session)
+            except queue.Full:
+                pass
+
+    def _run(self):
+        while True:
+            session = self._queue.get()
+            if session is None:
+                break
+            self.sample(session)
+
+    def function_totals(self, snapshot):
+        """
+        Sums traced memory by game_items.py function which made the allocation, directly or through helpers
+        of other modules. Statistics are grouped by traceback and each group is counted to its innermost
+        game_items.py frame.
+        :param snapshot: tracemalloc Snapshot
+        :return: dict of function name and tuple of size in bytes and number of blocks
+        """
+        file_path = self.index.file_path
+        totals = {}
+        for stat in snapshot.statistics("traceback"):
+            # frames of traceback are ordered from the oldest call
+            for frame in reversed(stat.traceback):
+                if frame.filename == file_path:
+                    name = self.index.name(frame.lineno)
+                    size, count = totals.get(name, (0, 0))
+                    totals[name] = (size + stat.size, count + stat.count)
+                    break
+        return totals
+
+    def sample(self, session):
+        """
+        Takes sample, exports it and logs warning when memory grows.
+        :param session: Session of the game
+        :return: dict of sample
+        """
+        start = perf_counter()
+        totals = self.function_totals(tracemalloc.take_snapshot())
+        functions = {}
+        for name in totals.keys() | self._functions.keys():
+            size, count = totals.get(name, (0, 0))
+            old_size, old_count = self._functions.get(name, (0, 0))
+            if size != old_size:
+                functions[name] = (size - old_size, count - old_count)
+        self._functions = totals
+
+        traced, _ = tracemalloc.get_traced_memory()
+        rss = read_rss()
+        if self._baseline is None:
+            self._baseline = (traced, rss)
+        top = sorted(functions.items(), key=lambda item: abs(item[1][0]), reverse=True)[:10]
+        sample = {
+            "time": time.time(),
+            "uptime_s": round(start - self._started, 1),
+            "rss_mb": rss / 2 ** 20 if rss is not None else None,
+            "rss_growth_mb": (rss - self._baseline[1]) / 2 ** 20 if rss is not None else None,
+            "traced_mb": traced / 2 ** 20,
+            "traced_growth_mb": (traced - self._baseline[0]) / 2 ** 20,
+            "live": None,
+            "subsystems": subsystem_counts(session),
+            "functions": [[name, size / 1024, count] for name, (size, count) in top],
+        }
+        if self.census:
+            live = live_objects((pygame.Surface, pygame.font.Font))
+            sample["live"] = {"surfaces": live[pygame.Surface], "fonts": live[pygame.font.Font]}
+        self.sample_ms = (perf_counter() - start) * 1000
+        sample["sample_ms"] = self.sample_ms
+        self.samples += 1
+        self.last = sample
+
+        growth = max(sample["traced_growth_mb"], sample["rss_growth_mb"] or 0)
+        if growth >= self.warn_mb * (self._warned + 1):
+            self._warned = int(growth // self.warn_mb)
+            logger.warning("memory grew by %.1f MB in %.0f s, rss %s MB, growing: %s", growth, sample["uptime_s"],
+                           f"{sample['rss_mb']:.1f}" if rss is not None else "?",
+                           ", ".join(f"{name} {size:+.0f} KB" for name, size, _ in sample["functions"][:3]))
+        if self.file_path:
+            with open(self.file_path, "a") as file:
+                file.write(json.dumps(sample) + "\n")
+        return sample
+
+    def close(self):
+        """
+        Waits for a running sample, stops sampler thread and tracing.
+        """
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        tracemalloc.stop()
+
+
+def subsystem_counts(session):
+    """
+    :param session: Session of the game
+    :return: dict of number of cached objects of every subsystem and of road objects
+    """
+    import game_items
+    import game_text
+    from game_assets import sprite_cache
+
+    simulation = session.simulation
+    counts = {
+        "sprites": len(sprite_cache),
+        "text": len(game_text.text_cache),
+        "fonts": len(game_text._fonts),
+        "glyph_atlases": len(game_text._atlases),
+        "background_strips": len(game_items._strips),
+        "animations": len(game_items._animations),
+        "masks": len(game_items._masks),
+        "model_specs": len(game_items._model_specs),
+        "menus": len(game_items._menus),
+        "scaled_sprites": len(getattr(session.renderer, "_sprites", ())),
+    }
+    for name, objects in (("enemies", simulation.enemies), ("coins", simulation.coins)):
+        counts[name] = len(objects.store)
+        counts[name + "_slots"] = objects.store.capacity
+    return counts
@@ -0,0 +1,106 @@
+import pygame
+from game_assets import sprite_cache
+from game_text import text_cache
+from game_input import MENU_EVENTS, allow_events
+from game_config import *
+
+
+def get_button_image():
+    """
+    Function makes button image adaptive to screen size
+    :return: adaptive button image
+    """
+    image = sprite_cache.load(BUTTON_PATH)
+    k_button_widht = image.get_width() / image.get_height()
+    return sprite_cache.load(BUTTON_PATH, ((DP_WIDTH // 10) * k_button_widht, DP_HEIGHT // 10))
+
+
+class Button:
+    def __init__(self, text: str, action: str, centerx: int, bottom: float):
+        """
+        Menu button with centered label, images are prepared once.
+        :param text: label of button
+        :param action: value returned by menu when button is clicked
+        :param centerx: x-coordinate of button center
+        :param bottom: y-coordinate of button bottom
+        """
+        self.action = action
+        self.image = get_button_image()
+        self.rect = self.image.get_rect(centerx=centerx, bottom=bottom)
+        self.hover_image = self.image.copy()
+        self.hover_image.fill((40, 40, 40, 0), special_flags=pygame.BLEND_RGBA_ADD)
+        self.label = text_cache.render(text, WHITE, 15)
+        self.label_rect = self.label.get_rect(center=self.rect.center)
+        self.hover = False
+        self.under = None
+
+    def draw(self, screen: pygame.surface):
+        """
+        Rendering function of button, restores what was under the button before drawing it.
+        :param screen: surface to draw on
+        :return: rect of button
+        """
+        if self.under is None:
+            self.under = screen.subsurface(self.rect.clip(screen.get_rect())).copy()
+        else:
+            screen.blit(self.under, self.rect)
+        screen.blit(self.hover_image if self.hover else self.image, self.rect)
+        screen.blit(self.label, self.label_rect)
+        return self.rect
+
+
+class Menu:
+    def __init__(self, screen: pygame.surface, buttons: list, keys: dict = None, background: pygame.Surface = None):
+        """
+        Menu screen which sleeps until user input comes.
+        :param screen: screen created with pygame surface for run process
+        :param buttons: list of Button
+        :param keys: dict of keyboard keys and actions they trigger
+        :param background: image drawn under buttons, None keeps current screen content
+        """
+        self.screen = screen
+        self.buttons = buttons
+        self.keys = keys or {}
+        self.background = background
+
+    def draw(self):
+        """
+        Draws the whole menu.
+        """
+        if self.background is not None:
+            self.screen.fill(GRAY)
+            self.screen.blit(self.background, self.background.get_rect(y=0, centerx=DP_WIDTH // 2))
+        mouse_pos = pygame.mouse.get_pos()
+        for button in self.buttons:
+            button.hover = button.rect.collidepoint(mouse_pos)
+            button.under = None
+            button.draw(self.screen)
+        pygame.display.update()
+
+    def run(self):
+        """
+        Shows menu and waits for user choice, screen is redrawn only when hovered button changes.
+        :return: action of chosen button or key, "exit" when window is closed
+        """
+        allow_events(MENU_EVENTS)
+        self.draw()
+        while True:
+            event = pygame.event.wait()
+            if event.type == pygame.QUIT:
+                return "exit"
+            elif event.type == pygame.KEYDOWN:
+                if event.key in self.keys:
+                    return self.keys[event.key]
+            elif event.type == pygame.MOUSEMOTION:
+                changed = []
+                for button in self.buttons:
+                    hover = button.rect.collidepoint(event.pos)
+                    if hover != button.hover:
+                        button.hover = hover
+                        changed.append(button.draw(self.screen))
+                if changed:
+                    pygame.display.update(changed)
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                for button in self.buttons:
+                    if button.rect.collidepoint(event.pos):
+                        return button.action
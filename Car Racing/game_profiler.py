@@ -0,0 +1,167 @@
+import json
+from time import perf_counter
+import numpy as np
+from game_config import FPS, PROFILE_FRAMES, DP_WIDTH, DP_HEIGHT
+
+SPAWN, IMMORTAL, MOVEMENT, COLLISION, DRAW, HUD, EVENTS, DISPLAY, CAPTURE, TELEMETRY = range(10)
+PHASES = ("spawn", "make_immortal", "movement", "collision", "draw", "hud", "events", "display", "capture",
+          "telemetry")
+
+
+class NullProfiler:
+    """
+    Profiler which measures nothing, used by headless simulations.
+    """
+    def begin_frame(self):
+        pass
+
+    def lap(self, phase: int):
+        pass
+
+    def end_frame(self):
+        pass
+
+    def input_latency(self, ms: float):
+        pass
+
+    def updated_pixels(self, pixels: int):
+        pass
+
+
+class FrameProfiler(NullProfiler):
+    def __init__(self, size: int = PROFILE_FRAMES):
+        """
+        Per phase timings of the last frames kept in a ring buffer.
+        :param size: number of frames kept
+        """
+        self.size = size
+        self.samples = np.zeros((size, len(PHASES) + 1))
+        # input to present latency of frames which showed new input, NaN for others
+        self.latencies = np.full(size, np.nan)
+        # pixels pushed to display by every frame
+        self.pixels = np.zeros(size)
+        self.frames = 0
+        self._current = [0.0] * len(PHASES)
+        self._start = self._last = perf_counter()
+        self._summary = None
+
+    def begin_frame(self):
+        """
+        Starts timing of a new frame.
+        """
+        for i in range(len(self._current)):
+            self._current[i] = 0.0
+        self.latencies[self.frames % self.size] = np.nan
+        self.pixels[self.frames % self.size] = 0
+        self._start = self._last = perf_counter()
+
+    def lap(self, phase: int):
+        """
+        Adds time passed since the previous lap to the phase.
+        :param phase: index of phase in PHASES
+        """
+        now = perf_counter()
+        self._current[phase] += now - self._last
+        self._last = now
+
+    def input_latency(self, ms: float):
+        """
+        Stores input latency of the current frame.
+        :param ms: time from input to present in milliseconds
+        """
+        self.latencies[self.frames % self.size] = ms
+
+    def updated_pixels(self, pixels: int):
+        """
+        Stores number of pixels which the current frame pushed to display.
+        :param pixels: area of updated screen regions
+        """
+        self.pixels[self.frames % self.size] = pixels
+
+    def end_frame(self):
+        """
+        Stores timings of the frame in milliseconds.
+        :return: frame time in milliseconds
+        """
+        row = self.samples[self.frames % self.size]
+        row[:-1] = self._current
+        row[-1] = self._last - self._start
+        row *= 1000
+        self.frames += 1
+        self._summary = None
+        return row[-1]
+
+    def recorded(self, samples=None):
+        """
+        :param samples: ring buffer of profiler, timings by default
+        :return: array of stored frames from the oldest to the newest, last column is frame total
+        """
+        if samples is None:
+            samples = self.samples
+        if self.frames <= self.size:
+            return samples[:self.frames]
+        index = self.frames % self.size
+        return np.concatenate((samples[index:], samples[:index]))
+
+    def latency_summary(self):
+        """
+        :return: p50, p95 and p99 of input latency in milliseconds and number of frames with input
+        """
+        latencies = self.recorded(self.latencies)
+        latencies = latencies[~np.isnan(latencies)]
+        if not len(latencies):
+            return 0.0, 0.0, 0.0, 0
+        return (*np.percentile(latencies, (50, 95, 99)).tolist(), len(latencies))
+
+    def pixel_summary(self):
+        """
+        :return: p50, p95 and p99 of pixels pushed to display per frame in percent of screen
+        """
+        pixels = self.recorded(self.pixels)
+        if not len(pixels):
+            return 0.0, 0.0, 0.0
+        return tuple((np.percentile(pixels, (50, 95, 99)) * 100 / (DP_WIDTH * DP_HEIGHT)).tolist())
+
+    def summary(self):
+        """
+        :return: array with p50, p95 and p99 rows, columns are phases and frame total, in milliseconds
+        """
+        if self._summary is None:
+            samples = self.recorded()
+            if len(samples):
+                self._summary = np.percentile(samples, (50, 95, 99), axis=0)
+            else:
+                self._summary = np.zeros((3, len(PHASES) + 1))
+        return self._summary
+
+    def dump(self, file_path: str):
+        """
+        Saves timings, input latency and updated pixels to CSV or, for .json files, to JSON with percentiles.
+        :param file_path: path to output file
+        """
+        samples = self.recorded()
+        latencies = self.recorded(self.latencies)
+        pixels = self.recorded(self.pixels)
+        columns = PHASES + ("total",)
+        if file_path.endswith(".json"):
+            summary = self.summary()
+            p50, p95, p99, count = self.latency_summary()
+            pixels_p50, pixels_p95, pixels_p99 = self.pixel_summary()
+            data = {
+                "budget_ms": 1000 / FPS,
+                "frames": self.frames,
+                "percentiles": {column: {"p50": summary[0, i], "p95": summary[1, i], "p99": summary[2, i]}
+                                for i, column in enumerate(columns)},
+                "input_latency": {"p50": p50, "p95": p95, "p99": p99, "frames": count},
+                "updated_pixels_percent": {"p50": pixels_p50, "p95": pixels_p95, "p99": pixels_p99,
+                                           "screen": DP_WIDTH * DP_HEIGHT},
+                "samples": {column: samples[:, i].tolist() for i, column in enumerate(columns)},
+            }
+            # frames without new input have no latency
+            data["samples"]["input_latency"] = [None if np.isnan(ms) else ms for ms in latencies.tolist()]
+            data["samples"]["updated_pixels"] = pixels.astype(int).tolist()
+            with open(file_path, "w") as file:
+                json.dump(data, file, indent=2)
+        else:
+            np.savetxt(file_path, np.column_stack((samples, latencies, pixels)), fmt="%.4f", delimiter=",",
+                       header=",".join(columns + ("input_latency", "updated_pixels")), comments="")
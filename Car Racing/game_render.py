@@ -0,0 +1,294 @@
+import pygame
+import game_items
+from game_profiler import NullProfiler, DRAW, HUD
+from game_config import *
+
+
+class HudLayer:
+    def __init__(self):
+        """
+        Stand-in for screen which collects HUD text instead of drawing it.
+        """
+        self.items = []
+
+    def blit(self, source: pygame.Surface, dest):
+        self.items.append((source, source.get_rect(topleft=dest)))
+
+
+class Renderer:
+    def __init__(self, screen: pygame.surface, profiler=None):
+        """
+        Draws the whole frame and pushes the whole screen to display.
+        :param screen: screen created with pygame surface for run process
+        :param profiler: FrameProfiler which gets timings of drawing phases
+        """
+        self.screen = screen
+        self.profiler = profiler if profiler is not None else NullProfiler()
+        self.updated_pixels = 0
+        self.enemy_labels = True
+        self.quality = None
+        self.scores = None
+        self.memory = None
+        self.capture = None
+
+    def invalidate(self):
+        """
+        Requests full repaint of the next frame, e.g. after a menu was drawn over the game.
+        """
+
+    def draw_world(self, simulation, alpha: float):
+        simulation.background.draw(alpha)
+        simulation.coins.draw(alpha)
+        simulation.enemies.draw(alpha)
+        simulation.user_car.draw(alpha)
+        self.profiler.lap(DRAW)
+
+    def draw_hud(self, surface, simulation, dev_info: bool):
+        game_items.show_score_info(dev_info, surface, self.scores, simulation.background)
+        game_items.show_dev_info(dev_info, surface, simulation.time, simulation.user_car, simulation.background,
+                                 simulation.enemies, simulation.coins, simulation.frame_count, self.enemy_labels)
+        game_items.show_player_info(dev_info, surface, simulation.time, simulation.coins, simulation.user_car,
+                                    simulation.score, simulation.background)
+        game_items.show_frame_profile(dev_info, surface, self.profiler)
+        game_items.show_quality_info(dev_info, surface, self.quality)
+        game_items.show_input_info(dev_info, surface, self.profiler)
+        game_items.show_memory_info(dev_info, surface, self.memory)
+        game_items.show_capture_info(dev_info, surface, self.capture)
+        self.profiler.lap(HUD)
+
+    def render(self, simulation, dev_info: bool, alpha: float = 1.0):
+        """
+        Draws current state of simulation on screen.
+        :param simulation: Simulation to draw
+        :param dev_info: bool value, whether developer info is shown
+        :param alpha: position between previous and current simulation step, 0..1
+        """
+        simulation.background.draw_margins()
+        self.draw_world(simulation, alpha)
+        self.draw_hud(self.screen, simulation, dev_info)
+
+    def present(self):
+        """
+        Pushes drawn frame to display.
+        """
+        pygame.display.update()
+        self.updated_pixels = DP_WIDTH * DP_HEIGHT
+
+
+class DirtyRenderer(Renderer):
+    def __init__(self, screen: pygame.surface, profiler=None):
+        """
+        Draws only changed regions of the frame: the road column with its sprites and HUD lines
+        whose text changed. Side margins are painted only on full repaints.
+        :param screen: screen created with pygame surface for run process
+        :param profiler: FrameProfiler which gets timings of drawing phases
+        """
+        super().__init__(screen, profiler)
+        self.hud = HudLayer()
+        self._full = True
+        self._lines = []
+        self._dirty = []
+
+    def invalidate(self):
+        self._full = True
+
+    def render(self, simulation, dev_info: bool, alpha: float = 1.0):
+        # developer info draws all over the screen, so it is shown with full repaints
+        if dev_info:
+            super().render(simulation, dev_info, alpha)
+            self._full = True
+            self._dirty = None
+            return
+
+        self.hud.items.clear()
+        self.draw_hud(self.hud, simulation, dev_info)
+        lines = self.hud.items[:]
+
+        if self._full:
+            simulation.background.draw_margins()
+            self.draw_world(simulation, alpha)
+            for surface, rect in lines:
+                self.screen.blit(surface, rect)
+            self.profiler.lap(HUD)
+            self._full = False
+            self._lines = lines
+            self._dirty = None
+            return
+
+        road = simulation.background.area
+
+        dirty = [road]
+        changed = [True] * len(lines)
+        # text cache returns the same surface while displayed value stays the same
+        for i, (surface, rect) in enumerate(lines):
+            if i < len(self._lines) and self._lines[i][0] is surface and self._lines[i][1] == rect:
+                changed[i] = False
+        for i, (_, rect) in enumerate(self._lines):
+            if i >= len(lines) or changed[i]:
+                self.screen.fill(GRAY, rect)
+                dirty.append(rect)
+
+        self.draw_world(simulation, alpha)
+
+        for (surface, rect), line_changed in zip(lines, changed):
+            if line_changed:
+                self.screen.blit(surface, rect)
+                dirty.append(rect)
+            elif rect.colliderect(road):
+                # road repaint covered part of the line, margin part is still on screen
+                self.screen.set_clip(road)
+                self.screen.blit(surface, rect)
+                self.screen.set_clip(None)
+        self.profiler.lap(HUD)
+
+        self._lines = lines
+        self._dirty = dirty
+
+    def present(self):
+        if self._dirty is None:
+            super().present()
+            return
+        pygame.display.update(self._dirty)
+        self.updated_pixels = sum(rect.width * rect.height for rect in self._dirty)
+
+
+class ScaledRenderer(Renderer):
+    def __init__(self, screen: pygame.surface, profiler=None, scale: float = RENDER_SCALE):
+        """
+        Draws the scrolling area of the world into a smaller surface and upscales it to the screen,
+        flat margins and HUD are drawn at full size. Sprites are scaled once for every render scale.
+        :param screen: screen created with pygame surface for run process
+        :param profiler: FrameProfiler which gets timings of drawing phases
+        :param scale: fraction of screen size used for the world
+        """
+        super().__init__(screen, profiler)
+        self.scale = None
+        self.canvas = None
+        self._sprites = {}
+        self.set_scale(scale)
+
+    def set_scale(self, scale: float):
+        """
+        :param scale: fraction of screen size used for the world, 1.0 draws straight to the screen
+        """
+        if scale != self.scale:
+            self.scale = scale
+            self.canvas = None
+            self._sprites.clear()
+
+    def _get_canvas(self, area: pygame.Rect):
+        """
+        :param area: screen area drawn in render scale
+        :return: surface for the area in render scale, it is created again when area changes
+        """
+        size = (round(area.width * self.scale), round(area.height * self.scale))
+        if self.canvas is None or self.canvas.get_size() != size:
+            self.canvas = pygame.Surface(size)
+            if pygame.display.get_surface() is not None:
+                self.canvas = self.canvas.convert()
+        return self.canvas
+
+    def _scaled(self, image: pygame.Surface):
+        """
+        :param image: sprite in screen size
+        :return: sprite in render scale
+        """
+        entry = self._sprites.get(id(image))
+        if entry is None:
+            width, height = image.get_size()
+            size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+            # original is kept in entry, so its id is not reused by another surface
+            entry = self._sprites[id(image)] = (image, pygame.transform.smoothscale(image, size))
+        return entry[1]
+
+    def draw_world(self, simulation, alpha: float):
+        if self.scale >= 1:
+            super().draw_world(simulation, alpha)
+            return
+
+        scale = self.scale
+        background = simulation.background
+        area = background.area
+        canvas = self._get_canvas(area)
+        left = area.x
+        height = canvas.get_height()
+        for layer, y in background.scroll(alpha):
+            canvas.blit(self._scaled(layer.strip), (round((layer.rect.x - left) * scale), 0),
+                        (0, round((DP_HEIGHT - y) * scale), round(layer.rect.width * scale), height))
+
+        scaled = self._scaled
+        canvas.blits([(scaled(image), (round((x - left) * scale), round(y * scale)))
+                      for image, (x, y) in simulation.coins.store.blit_items(alpha)], doreturn=False)
+        canvas.blits([(scaled(image), (round((x - left) * scale), round(y * scale)))
+                      for image, (x, y) in simulation.enemies.store.blit_items(alpha)], doreturn=False)
+        x, y = simulation.user_car.position(alpha)
+        canvas.blit(scaled(simulation.user_car.image), (round((x - left) * scale), round(y * scale)))
+
+        pygame.transform.scale(canvas, area.size, self.screen.subsurface(area))
+        self.profiler.lap(DRAW)
+
+
+class QualityController:
+    def __init__(self, renderer: ScaledRenderer, background, levels: list = QUALITY_LEVELS,
+                 budget_ms: float = None, window: int = 30):
+        """
+        Watches frame times and moves between quality levels: lowers quality when average frame time
+        gets close to frame budget and restores it when there is enough headroom.
+        Restore waits longer every time a restored level had to be dropped again.
+        :param renderer: ScaledRenderer of the game
+        :param background: Background of the game
+        :param levels: list of (render scale, per-enemy dev labels, parallax layers) from the best quality
+        :param budget_ms: frame budget, frame time of RENDER_FPS or FPS when RENDER_FPS is unlimited
+        :param window: frames between two changes of quality
+        """
+        self.renderer = renderer
+        self.background = background
+        self.levels = levels
+        self.budget_ms = budget_ms if budget_ms is not None else 1000 / (RENDER_FPS or FPS)
+        self.window = window
+        self.level = 0
+        self.average = 0.0
+        self.changes = 0
+        self._frames = 0
+        self._restore_wait = 4 * window
+        self._restored = False
+        self.set_level(0)
+
+    def set_level(self, level: int):
+        """
+        Applies quality level to renderer and background.
+        :param level: index in levels
+        """
+        scale, enemy_labels, layers = self.levels[level]
+        self.renderer.set_scale(scale)
+        self.renderer.enemy_labels = enemy_labels
+        self.background.set_detail(layers)
+        self.renderer.invalidate()
+        if level != self.level:
+            self.changes += 1
+        self.level = level
+        self._frames = 0
+
+    def update(self, frame_ms: float):
+        """
+        Takes time of the last frame, called once per frame.
+        :param frame_ms: frame time in milliseconds
+        :return: True when quality level was changed
+        """
+        # exponential moving average reacts to sustained load, not to single hitches
+        self.average += (frame_ms - self.average) * 0.1
+        self._frames += 1
+        if self._frames < self.window:
+            return False
+
+        if self.average > self.budget_ms * QUALITY_DROP and self.level < len(self.levels) - 1:
+            if self._restored and self._frames < self._restore_wait:
+                self._restore_wait = min(self._restore_wait * 2, 64 * self.window)
+            self._restored = False
+            self.set_level(self.level + 1)
+            return True
+        if self.average < self.budget_ms * QUALITY_RESTORE and self.level > 0 and self._frames >= self._restore_wait:
+            self._restored = True
+            self.set_level(self.level - 1)
+            return True
+        return False
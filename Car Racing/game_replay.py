@@ -0,0 +1,175 @@
+import math
+import struct
+import zlib
+from os import path
+from game_config import FPS
+
+MAGIC = b"CRRP"
+# version 2: diagonal keys move user car along both axes, version 3: pixel collisions
+VERSION = 3
+
+# magic, version, fps, model name length, start health, seed, frames, score, coins, final health
+_HEADER = struct.Struct("<4sBBBhQIdIh")
+
+
+class ReplayError(Exception):
+    pass
+
+
+class Recording:
+    def __init__(self, seed: int, model: str, health: int, fps: int = FPS):
+        """
+        Input log of one game: seed of spawn generator and pressed keys of every simulation step.
+        Keys are stored as Keys flags packed in one byte per step, file is compressed with zlib.
+        :param seed: seed of spawn generator
+        :param model: name of user car model
+        :param health: user car health at start
+        :param fps: simulation steps per second
+        """
+        self.seed = seed
+        self.model = model
+        self.health = health
+        self.fps = fps
+        self.frames = bytearray()
+        self.score = 0.0
+        self.coins = 0
+        self.final_health = health
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, frame: int):
+        return self.frames[frame]
+
+    def append(self, keys: int):
+        """
+        Adds keys of the next simulation step.
+        :param keys: Keys flags pressed in the step
+        """
+        self.frames.append(keys)
+
+    def finish(self, simulation):
+        """
+        Stores result of the game, replays are checked against it.
+        :param simulation: Simulation which played the recorded game
+        """
+        self.score = simulation.score
+        self.coins = simulation.coins.count
+        self.final_health = simulation.user_car.health
+
+    def save(self, file_path: str):
+        """
+        Writes recording to binary file.
+        :param file_path: path to output file
+        """
+        model = self.model.encode()
+        header = _HEADER.pack(MAGIC, VERSION, self.fps, len(model), self.health, self.seed, len(self.frames),
+                              self.score, self.coins, self.final_health)
+        with open(file_path, "wb") as file:
+            file.write(header + model + zlib.compress(bytes(self.frames), 9))
+
+    @classmethod
+    def load(cls, file_path: str):
+        """
+        Reads recording from binary file.
+        :param file_path: path to recording
+        :return: Recording
+        """
+        with open(file_path, "rb") as file:
+            data = file.read()
+        if len(data) < _HEADER.size:
+            raise ReplayError(f"{file_path}: file is too short")
+        magic, version, fps, model_size, health, seed, frames, score, coins, final_health = \
+            _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ReplayError(f"{file_path}: not a recording")
+        if version != VERSION:
+            raise ReplayError(f"{file_path}: unsupported version {version}")
+
+        offset = _HEADER.size + model_size
+        recording = cls(seed, data[_HEADER.size:offset].decode(), health, fps)
+        try:
+            recording.frames = bytearray(zlib.decompress(data[offset:]))
+        except zlib.error as error:
+            raise ReplayError(f"{file_path}: damaged key log, {error}")
+        if len(recording.frames) != frames:
+            raise ReplayError(f"{file_path}: {len(recording.frames)} frames stored, {frames} expected")
+        recording.score = score
+        recording.coins = coins
+        recording.final_health = final_health
+        return recording
+
+    def mismatches(self, simulation):
+        """
+        Compares result of replayed game with the recorded one.
+        :param simulation: Simulation which played the recording
+        :return: list of (name, recorded value, replayed value) of values which differ
+        """
+        result = []
+        if simulation.frame_count != len(self.frames):
+            result.append(("frames", len(self.frames), simulation.frame_count))
+        if not math.isclose(simulation.score, self.score, rel_tol=1e-9, abs_tol=1e-9):
+            result.append(("score", self.score, simulation.score))
+        if simulation.coins.count != self.coins:
+            result.append(("coins", self.coins, simulation.coins.count))
+        if simulation.user_car.health != self.final_health:
+            result.append(("health", self.final_health, simulation.user_car.health))
+        return result
+
+    def verify(self, simulation):
+        """
+        Raises ReplayError when replayed game ended differently from the recorded one.
+        :param simulation: Simulation which played the recording
+        """
+        mismatches = self.mismatches(simulation)
+        if mismatches:
+            raise ReplayError("replay differs from recording: " + ", ".join(
+                f"{name} {recorded} != {replayed}" for name, recorded, replayed in mismatches))
+
+
+def read_header(file_path: str):
+    """
+    Reads settings of recorded game without decompressing key log.
+    :param file_path: path to recording
+    :return: tuple of user car model name and start health
+    """
+    with open(file_path, "rb") as file:
+        data = file.read(_HEADER.size + 255)
+    if len(data) < _HEADER.size or data[:4] != MAGIC:
+        raise ReplayError(f"{file_path}: not a recording")
+    fields = _HEADER.unpack_from(data)
+    return data[_HEADER.size:_HEADER.size + fields[3]].decode(), fields[4]
+
+
+def numbered_path(file_path: str, number: int):
+    """
+    :param file_path: path given by user
+    :param number: number of game in session, counted from 1
+    :return: file_path for the first game, file_path with number before extension for the next ones
+    """
+    if number <= 1:
+        return file_path
+    root, ext = path.splitext(file_path)
+    return f"{root}-{number}{ext}"
+
+
+def play_headless(recording: Recording):
+    """
+    Replays recording without display as fast as possible and checks its result.
+    Configuration must match the recorded game, see game_config.cliargparse.
+    :param recording: Recording to play
+    :return: Simulation after the last recorded step
+    """
+    from game_engine import Simulation
+    from game_items import Keys
+
+    if recording.fps != FPS:
+        raise ReplayError(f"recording was made with {recording.fps} steps per second, game runs {FPS}")
+    keys = [Keys(value) for value in range(64)]
+    simulation = Simulation(seed=recording.seed)
+    step = simulation.step
+    for value in recording.frames:
+        if not step(keys[value & 63]):
+            break
+    recording.verify(simulation)
+    return simulation
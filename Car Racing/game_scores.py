@@ -0,0 +1,285 @@
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+from game_config import SCORE_TOP_SIZE, SCORE_COMPACT_RECORDS
+
+MAGIC = b"CRSC"
+VERSION = 1
+
+_FILE_HEADER = struct.Struct("<4sB")
+# payload size, crc32 of payload
+_RECORD = struct.Struct("<II")
+# kind, time, score, coins, frames, model name length
+_GAME = struct.Struct("<BddIIB")
+# kind, games, frames, coins of games dropped by compaction
+_TOTALS = struct.Struct("<BQQQ")
+GAME, TOTALS = 1, 2
+
+logger = logging.getLogger(__name__)
+
+ScoreEntry = namedtuple("ScoreEntry", "time score coins frames model")
+
+
+class ScoreError(Exception):
+    pass
+
+
+class ScoreIndex:
+    def __init__(self, size: int = SCORE_TOP_SIZE):
+        """
+        Best games and totals of all games, kept in memory and read by HUD.
+        :param size: number of best games kept
+        """
+        self.size = size
+        self.top = []
+        self.last = None
+        self.games = 0
+        self.frames = 0
+        self.coins = 0
+
+    @property
+    def best(self):
+        return self.top[0].score if self.top else 0
+
+    @property
+    def previous(self):
+        return self.last.score if self.last is not None else 0
+
+    def add(self, entry: ScoreEntry):
+        """
+        :param entry: ScoreEntry of finished game
+        """
+        self.last = entry
+        self.games += 1
+        self.frames += entry.frames
+        self.coins += entry.coins
+        if len(self.top) < self.size or entry.score > self.top[-1].score:
+            self.top.append(entry)
+            self.top.sort(key=lambda game: game.score, reverse=True)
+            del self.top[self.size:]
+
+    def copy(self):
+        index = ScoreIndex(self.size)
+        index.top = list(self.top)
+        index.last = self.last
+        index.add_totals(self.games, self.frames, self.coins)
+        return index
+
+    def add_totals(self, games: int, frames: int, coins: int):
+        self.games += games
+        self.frames += frames
+        self.coins += coins
+
+    def entries(self):
+        """
+        :return: games which are kept after compaction in order they were played, the last game is the last
+        """
+        entries = sorted((entry for entry in self.top if entry is not self.last), key=lambda game: game.time)
+        if self.last is not None:
+            entries.append(self.last)
+        return entries
+
+
+def encode_game(entry: ScoreEntry):
+    model = entry.model.encode()[:255]
+    return _GAME.pack(GAME, entry.time, entry.score, entry.coins, entry.frames, len(model)) + model
+
+
+def encode_totals(games: int, frames: int, coins: int):
+    return _TOTALS.pack(TOTALS, games, frames, coins)
+
+
+def frame_record(payload: bytes):
+    """
+    :param payload: encoded game or totals
+    :return: record of log with size and checksum of payload
+    """
+    return _RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_log(file_path: str, index: ScoreIndex):
+    """
+    Reads records of log into index. Reading stops at the first incomplete or damaged record,
+    which is left by a write interrupted by crash or power cut.
+    :param file_path: path to log
+    :param index: ScoreIndex filled with records
+    :return: tuple of size of valid part of log and number of records
+    """
+    with open(file_path, "rb") as file:
+        data = file.read()
+    if len(data) < _FILE_HEADER.size:
+        return 0, 0
+    magic, version = _FILE_HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ScoreError(f"{file_path}: not a score log")
+    if version != VERSION:
+        raise ScoreError(f"{file_path}: unsupported version {version}")
+
+    offset = _FILE_HEADER.size
+    records = 0
+    while offset + _RECORD.size <= len(data):
+        size, crc = _RECORD.unpack_from(data, offset)
+        start = offset + _RECORD.size
+        payload = data[start:start + size]
+        if len(payload) != size or zlib.crc32(payload) != crc or not payload:
+            break
+        if payload[0] == GAME and size >= _GAME.size:
+            _, played, score, coins, frames, model_size = _GAME.unpack_from(payload)
+            model = payload[_GAME.size:_GAME.size + model_size].decode(errors="replace")
+            index.add(ScoreEntry(played, score, coins, frames, model))
+        elif payload[0] == TOTALS and size >= _TOTALS.size:
+            index.add_totals(*_TOTALS.unpack_from(payload)[1:])
+        else:
+            break
+        offset = start + size
+        records += 1
+    return offset, records
+
+
+class ScoreStore:
+    def __init__(self, file_path: str = None, size: int = SCORE_TOP_SIZE,
+                 compact_records: int = SCORE_COMPACT_RECORDS):
+        """
+        Scores of finished games saved in append-only log. Index in memory is updated at once,
+        records are written and synced by background thread, so the game loop never waits for disk.
+        When log grows over compact_records records, it is rewritten with the best games and totals of others.
+        When log can not be opened or written, e.g. in read-only game directory, scores are kept only in memory.
+        :param file_path: path to log, None keeps scores only in memory
+        :param size: number of best games kept
+        :param compact_records: number of records in log which starts compaction
+        """
+        self.file_path = file_path
+        self.index = ScoreIndex(size)
+        self.compact_records = compact_records
+        self.compactions = 0
+        self.recovered_bytes = 0
+        self._queue = None
+        self._thread = None
+        if file_path is None:
+            return
+
+        # writer thread owns its copy of index, it matches the log and is written by compaction
+        self._written = ScoreIndex(size)
+        self._records = 0
+        try:
+            self._file = self._open()
+        except OSError as error:
+            logger.warning("scores are kept only in memory: %s", error)
+            self.file_path = None
+            self.index = self._written.copy()
+            return
+        self.index = self._written.copy()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="score-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def best(self):
+        return self.index.best
+
+    @property
+    def previous(self):
+        return self.index.previous
+
+    def _open(self):
+        """
+        Opens log for appending, damaged tail of log is cut off before the first new record.
+        Log with foreign or damaged header is renamed with .bad suffix and a new log is started.
+        :return: file object
+        """
+        if not os.path.exists(self.file_path):
+            self._rewrite([])
+        try:
+            valid, self._records = read_log(self.file_path, self._written)
+        except ScoreError as error:
+            bad_path = self.file_path + ".bad"
+            logger.warning("%s, moved to %s", error, bad_path)
+            os.replace(self.file_path, bad_path)
+            self._rewrite([])
+            valid, self._records = read_log(self.file_path, self._written)
+        file = open(self.file_path, "r+b")
+        file.seek(0, os.SEEK_END)
+        if valid < _FILE_HEADER.size:
+            file.seek(0)
+            file.truncate()
+            file.write(_FILE_HEADER.pack(MAGIC, VERSION))
+            valid = _FILE_HEADER.size
+        elif file.tell() > valid:
+            self.recovered_bytes = file.tell() - valid
+            file.truncate(valid)
+        file.seek(valid)
+        return file
+
+    def _rewrite(self, payloads: list):
+        """
+        Replaces log with the records, temporary file is renamed over log, so crash leaves one of them whole.
+        :param payloads: list of encoded records
+        """
+        temp_path = self.file_path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(_FILE_HEADER.pack(MAGIC, VERSION))
+            file.write(b"".join(frame_record(payload) for payload in payloads))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.file_path)
+
+    def add(self, score: float, coins: int, frames: int, model: str):
+        """
+        Adds finished game, returns without waiting for disk.
+        :param score: final score
+        :param coins: collected coins
+        :param frames: simulation steps of the game
+        :param model: name of user car model
+        :return: ScoreEntry of game
+        """
+        entry = ScoreEntry(time.time(), score, coins, frames, model)
+        self.index.add(entry)
+        if self._queue is not None:
+            self._queue.put(entry)
+        return entry
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                break
+            self._file.write(frame_record(encode_game(entry)))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._written.add(entry)
+            self._records += 1
+            if self._records > self.compact_records:
+                self.compact()
+        self._file.close()
+
+    def compact(self):
+        """
+        Rewrites log with totals of dropped games, the best games and the last one.
+        Called by writer thread, or by owner of store after close.
+        """
+        written = self._written
+        entries = written.entries()
+        dropped = (written.games - len(entries), written.frames - sum(entry.frames for entry in entries),
+                   written.coins - sum(entry.coins for entry in entries))
+        payloads = ([encode_totals(*dropped)] if dropped[0] else []) + [encode_game(entry) for entry in entries]
+        self._file.close()
+        self._rewrite(payloads)
+        self._file = open(self.file_path, "r+b")
+        self._file.seek(0, os.SEEK_END)
+        self._records = len(payloads)
+        self.compactions += 1
+
+    def close(self):
+        """
+        Writes remaining games and stops writer thread.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._queue = None
@@ -0,0 +1,351 @@
+import json
+import os
+import queue
+import selectors
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from game_config import FPS, TELEMETRY_QUEUE_SIZE, TELEMETRY_KEYFRAME, TELEMETRY_BACKLOG
+
+VERSION = 1
+HELLO, KEY, DELTA = range(3)
+
+# body size, message type
+_MESSAGE = struct.Struct("<IB")
+# game, frame, capture wall time, score, road speed, user car x, y, width, height, health, immortal
+_STATE = struct.Struct("<IIddHhhhhbB")
+_COUNT = struct.Struct("<H")
+# id, model, x, y, width, height
+_ENTITY = struct.Struct("<IHhhhh")
+# id, change of x and y
+_MOVE = struct.Struct("<Ihh")
+_ID = struct.Struct("<I")
+
+
+def parse_address(address: str):
+    """
+    :param address: "host:port", "port" or "unix:path"
+    :return: tuple of socket family and address
+    """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[5:]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def capture(simulation, game: int = 0):
+    """
+    Takes world state from simulation, called by game loop after simulation steps.
+    :param simulation: Simulation to publish
+    :param game: number of game in session, ids of entities start again in every game
+    :return: tuple of state fields, enemy rows and coin rows, rows are [id, model, x, y, width, height]
+    """
+    car = simulation.user_car
+    rect = car.rect
+    state = (game, simulation.frame_count, time.time(), simulation.score, simulation.background.speed,
+             rect.x, rect.y, rect.width, rect.height, car.health, car.immortal)
+    return state, _entity_rows(simulation.enemies.store), _entity_rows(simulation.coins.store)
+
+
+def _entity_rows(store):
+    slots = store.active()
+    return np.column_stack((store.seq[slots], store.model[slots], store.x[slots], store.y[slots],
+                            store.w[slots], store.h[slots])).tolist()
+
+
+def encode_snapshot(snapshot: tuple, baseline: tuple = None):
+    """
+    Encodes snapshot as keyframe or as changes since baseline. Entities are matched by id:
+    removed ones are sent as ids, new ones whole, and the others as moves of their position.
+    :param snapshot: tuple returned by capture
+    :param baseline: snapshot last sent to the client, None for keyframe
+    :return: message bytes
+    """
+    state, *groups = snapshot
+    parts = [_STATE.pack(*state)]
+    if baseline is None:
+        for rows in groups:
+            parts.append(_COUNT.pack(len(rows)))
+            parts.extend(_ENTITY.pack(*row) for row in rows)
+        kind = KEY
+    else:
+        for rows, old_rows in zip(groups, baseline[1:]):
+            old = {row[0]: row for row in old_rows}
+            new_ids = {row[0] for row in rows}
+            removed = [entity_id for entity_id in old if entity_id not in new_ids]
+            added = [row for row in rows if row[0] not in old]
+            moved = [(row[0], row[2] - old[row[0]][2], row[3] - old[row[0]][3]) for row in rows
+                     if row[0] in old and (row[2] != old[row[0]][2] or row[3] != old[row[0]][3])]
+            parts.append(_COUNT.pack(len(removed)))
+            parts.extend(_ID.pack(entity_id) for entity_id in removed)
+            parts.append(_COUNT.pack(len(added)))
+            parts.extend(_ENTITY.pack(*row) for row in added)
+            parts.append(_COUNT.pack(len(moved)))
+            parts.extend(_MOVE.pack(*move) for move in moved)
+        kind = DELTA
+    body = b"".join(parts)
+    return _MESSAGE.pack(len(body), kind) + body
+
+
+def encode_hello(models: dict):
+    """
+    :param models: dict of model id and [name, rotation]
+    :return: first message of stream with description of models
+    """
+    body = json.dumps({"version": VERSION, "fps": FPS, "models": models}).encode()
+    return _MESSAGE.pack(len(body), HELLO) + body
+
+
+class WorldState:
+    def __init__(self):
+        """
+        World state rebuilt from telemetry messages by a client.
+        Entities are dicts of id and [model, x, y, width, height].
+        """
+        self.models = {}
+        self.game = 0
+        self.frame = 0
+        self.captured = 0.0
+        self.score = 0.0
+        self.speed = 0
+        self.car = (0, 0, 0, 0)
+        self.health = 0
+        self.immortal = False
+        self.enemies = {}
+        self.coins = {}
+
+    def apply(self, kind: int, body: bytes):
+        """
+        Applies one message to the state.
+        :param kind: message type
+        :param body: message body
+        """
+        if kind == HELLO:
+            hello = json.loads(body)
+            if hello["version"] != VERSION:
+                raise ValueError(f"unsupported telemetry version {hello['version']}")
+            self.models = {int(model_id): tuple(model) for model_id, model in hello["models"].items()}
+            return
+
+        (self.game, self.frame, self.captured, self.score, self.speed, x, y, width, height, self.health,
+         immortal) = _STATE.unpack_from(body)
+        self.car = (x, y, width, height)
+        self.immortal = bool(immortal)
+        offset = _STATE.size
+        for entities in (self.enemies, self.coins):
+            if kind == KEY:
+                entities.clear()
+                offset = self._read_entities(body, offset, entities)
+                continue
+            (count,) = _COUNT.unpack_from(body, offset)
+            offset += _COUNT.size
+            for (entity_id,) in _ID.iter_unpack(body[offset:offset + count * _ID.size]):
+                del entities[entity_id]
+            offset += count * _ID.size
+            offset = self._read_entities(body, offset, entities)
+            (count,) = _COUNT.unpack_from(body, offset)
+            offset += _COUNT.size
+            for entity_id, dx, dy in _MOVE.iter_unpack(body[offset:offset + count * _MOVE.size]):
+                entity = entities[entity_id]
+                entity[1] += dx
+                entity[2] += dy
+            offset += count * _MOVE.size
+
+    @staticmethod
+    def _read_entities(body: bytes, offset: int, entities: dict):
+        (count,) = _COUNT.unpack_from(body, offset)
+        offset += _COUNT.size
+        for entity_id, *entity in _ENTITY.iter_unpack(body[offset:offset + count * _ENTITY.size]):
+            entities[entity_id] = entity
+        return offset + count * _ENTITY.size
+
+
+def read_messages(sock: socket.socket):
+    """
+    Reads messages from blocking socket until the server closes it.
+    :param sock: connected socket
+    :return: generator of (type, body, message size)
+    """
+    buffer = bytearray()
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            return
+        buffer += data
+        offset = 0
+        while len(buffer) - offset >= _MESSAGE.size:
+            size, kind = _MESSAGE.unpack_from(buffer, offset)
+            end = offset + _MESSAGE.size + size
+            if end > len(buffer):
+                break
+            yield kind, bytes(buffer[offset + _MESSAGE.size:end]), end - offset
+            offset = end
+        del buffer[:offset]
+
+
+class _Client:
+    def __init__(self, sock: socket.socket, hello: bytes):
+        self.sock = sock
+        self.pending = bytearray(hello)
+        self.baseline = None
+        self.since_key = 0
+        self.skipped = 0
+
+
+class TelemetryServer:
+    def __init__(self, address: str, models: dict = None, queue_size: int = TELEMETRY_QUEUE_SIZE,
+                 keyframe: int = TELEMETRY_KEYFRAME, backlog: int = TELEMETRY_BACKLOG):
+        """
+        Publishes world state to spectators connected to local TCP or Unix socket.
+        Game loop only captures state and puts it in a bounded queue, snapshots which do not fit are dropped.
+        Sender thread encodes them per client as deltas against the last snapshot sent to that client
+        and writes to non-blocking sockets. Client which does not read is skipped until its backlog is sent,
+        then it gets a keyframe.
+        :param address: "host:port", "port" or "unix:path"
+        :param models: dict of model id and [name, rotation], sent to every client when it connects
+        :param queue_size: max snapshots waiting for sender thread
+        :param keyframe: snapshots between keyframes of one client
+        :param backlog: max bytes waiting in socket of one client before its snapshots are skipped
+        """
+        self.address = address
+        self.keyframe = keyframe
+        self.backlog = backlog
+        self.published = 0
+        self.dropped = 0
+        self.sent_bytes = 0
+        self.clients = 0
+        self.games = 0
+        self._hello = encode_hello(models or {})
+        self._last_frame = -1
+        self._queued = None
+
+        family, self._bind = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(self._bind):
+            os.remove(self._bind)
+        self._listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(self._bind)
+        self._listener.listen()
+        self._listener.setblocking(False)
+        self.bound = self._listener.getsockname()
+
+        self._queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._run, name="telemetry-sender", daemon=True)
+        self._thread.start()
+
+    @property
+    def queued(self):
+        """
+        :return: number of snapshots waiting for sender thread
+        """
+        return self._queue.qsize()
+
+    def publish(self, simulation):
+        """
+        Captures world state for spectators, never waits for sender thread.
+        :param simulation: Simulation to publish
+        """
+        frame = simulation.frame_count
+        if frame < self._last_frame:
+            self.games += 1
+        self._last_frame = frame
+        if self._queued == (self.games, frame):
+            return
+        try:
+            self._queue.put_nowait(capture(simulation, self.games))
+            self._queued = (self.games, frame)
+            self.published += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._listener, selectors.EVENT_READ)
+        clients = []
+        running = True
+        while running:
+            try:
+                snapshot = self._queue.get(timeout=0.05)
+            except queue.Empty:
+                snapshot = None
+            if snapshot is False:
+                running = False
+                snapshot = None
+
+            for key, _ in selector.select(0):
+                if key.fileobj is self._listener:
+                    self._accept(clients)
+
+            if snapshot is not None:
+                for client in clients:
+                    if len(client.pending) > self.backlog:
+                        client.baseline = None
+                        client.skipped += 1
+                        continue
+                    # ids of entities start again in a new game, so deltas against the previous one are not valid
+                    keyframe = (client.baseline is None or client.baseline[0][0] != snapshot[0][0]
+                                or client.since_key >= self.keyframe)
+                    client.pending += encode_snapshot(snapshot, None if keyframe else client.baseline)
+                    client.baseline = snapshot
+                    client.since_key = 0 if keyframe else client.since_key + 1
+
+            for client in list(clients):
+                if not self._flush(client):
+                    clients.remove(client)
+                    client.sock.close()
+            self.clients = len(clients)
+
+        # data of the last snapshots is sent to clients which still read
+        for client in clients:
+            try:
+                client.sock.settimeout(1.0)
+                client.sock.sendall(client.pending)
+                self.sent_bytes += len(client.pending)
+            except OSError:
+                pass
+            client.sock.close()
+        selector.close()
+
+    def _accept(self, clients: list):
+        while True:
+            try:
+                sock, _ = self._listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            if sock.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            clients.append(_Client(sock, self._hello))
+
+    def _flush(self, client: _Client):
+        """
+        Sends as much of pending data as socket takes without blocking.
+        :return: False when client has disconnected
+        """
+        if not client.pending:
+            return True
+        try:
+            sent = client.sock.send(client.pending)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            return False
+        del client.pending[:sent]
+        self.sent_bytes += sent
+        return True
+
+    def close(self):
+        """
+        Stops sender thread and closes all connections.
+        """
+        if self._thread is None:
+            return
+        self._queue.put(False)
+        self._thread.join()
+        self._thread = None
+        self._listener.close()
+        if self._listener.family == socket.AF_UNIX and os.path.exists(self._bind):
+            os.remove(self._bind)
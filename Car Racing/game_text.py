@@ -0,0 +1,111 @@
+import pygame
+from game_assets import LRUCache
+from game_config import TEXT_CACHE_SIZE
+
+_fonts = {}
+
+
+def get_font(size: int):
+    """
+    Returns default font of the given size, every size is created only once.
+    :param size: font size
+    :return: pygame font
+    """
+    font = _fonts.get(size)
+    if font is None:
+        font = _fonts[size] = pygame.font.Font(pygame.font.get_default_font(), size)
+    return font
+
+
+class TextCache(LRUCache):
+    def render(self, text: str, color: tuple, size: int):
+        """
+        Returns rendered text, same text is rendered only once while it stays in cache.
+        :param text: text to render
+        :param color: color of text
+        :param size: font size
+        :return: surface with antialiased text
+        """
+        return self.get((text, color, size), lambda: get_font(size).render(text, True, color))
+
+
+class GlyphAtlas:
+    def __init__(self, size: int, color: tuple, glyphs: str = "0123456789.,-[] "):
+        """
+        Pre-rendered characters for fast changing numbers, text is drawn by blitting glyphs one by one.
+        :param size: font size
+        :param color: color of text
+        :param glyphs: characters kept in atlas
+        """
+        self.size = size
+        self.color = color
+        self.glyphs = {char: get_font(size).render(char, True, color) for char in glyphs}
+
+    def draw(self, screen: pygame.surface, text: str, pos: tuple):
+        """
+        Draws text on screen, characters missing in atlas are rendered through text cache.
+        :param screen: surface to draw on
+        :param text: text to draw
+        :param pos: top left position of text
+        :return: x-coordinate of text end
+        """
+        x, y = pos
+        items = []
+        for char in text:
+            glyph = self.glyphs.get(char)
+            if glyph is None:
+                glyph = text_cache.render(char, self.color, self.size)
+            items.append((glyph, (x, y)))
+            x += glyph.get_width()
+        screen.blits(items, doreturn=False)
+        return x
+
+
+_atlases = {}
+
+
+def get_atlas(size: int, color: tuple):
+    """
+    :param size: font size
+    :param color: color of text
+    :return: shared GlyphAtlas of the given size and color
+    """
+    atlas = _atlases.get((size, color))
+    if atlas is None:
+        atlas = _atlases[(size, color)] = GlyphAtlas(size, color)
+    return atlas
+
+
+text_cache = TextCache(TEXT_CACHE_SIZE)
+
+
+def draw_value(screen: pygame.surface, label: str, value, color: tuple, size: int, pos: tuple):
+    """
+    Draws static label through text cache and fast changing value through glyph atlas.
+    :param screen: surface to draw on
+    :param label: static part of text
+    :param value: value shown after label
+    :param color: color of text
+    :param size: font size
+    :param pos: top left position of text
+    :return: x-coordinate of text end
+    """
+    label_image = text_cache.render(label, color, size)
+    screen.blit(label_image, pos)
+    return get_atlas(size, color).draw(screen, str(value), (pos[0] + label_image.get_width(), pos[1]))
+
+
+def draw_values(screen: pygame.surface, parts: list, color: tuple, size: int, pos: tuple):
+    """
+    Draws line of static labels, each followed by its fast changing value, see draw_value.
+    :param screen: surface to draw on
+    :param parts: list of (label, value) pairs, value None shows only label
+    :param color: color of text
+    :param size: font size
+    :param pos: top left position of line
+    :return: x-coordinate of line end
+    """
+    x, y = pos
+    for label, value in parts:
+        x = draw_value(screen, label, "" if value is None else value, color, size, (x, y))
+    return x
@@ -1,8 +1,68 @@
+import game_config
+
+game_config.cliargparse()
+
 from game_items import *
 
+if REPLAY_HEADLESS:
+    import sys
+    from time import perf_counter
+    from game_replay import Recording, ReplayError, play_headless
+
+    start = perf_counter()
+    try:
+        simulation = play_headless(Recording.load(REPLAY_PATH))
+    except ReplayError as error:
+        sys.exit(error)
+    print(f"{REPLAY_PATH}: {simulation.frame_count} frames in {(perf_counter() - start) * 1000:.1f} ms, "
+          f"score {simulation.score:.2f}, coins {simulation.coins.count}, health {simulation.user_car.health}")
+    sys.exit()
+
 pygame.init()
 screen = pygame.display.set_mode((DP_WIDTH, DP_HEIGHT))
 
-start_screen(screen, BG_PATH)
+if REPLAY_PATH:
+    import sys
+    from game_replay import Recording, ReplayError
+
+    try:
+        replay = Recording.load(REPLAY_PATH)
+    except ReplayError as error:
+        pygame.quit()
+        sys.exit(str(error))
+    session = Session(screen, replay)
+    state = GameState.PLAYING
+    while state is not GameState.EXIT:
+        if state is GameState.PLAYING:
+            state = magic(session)
+        elif state is GameState.PAUSED:
+            state = pause_screen(screen)
+        elif state is GameState.GAME_OVER:
+            mismatches = replay.mismatches(session.simulation)
+            print(f"{REPLAY_PATH}: " + ("result matches recording" if not mismatches else ", ".join(
+                f"{name} {recorded} != {replayed}" for name, recorded, replayed in mismatches)))
+            state = GameState.EXIT
+else:
+    session = Session(screen)
+    state = GameState.START
+    while state is not GameState.EXIT:
+        if state is GameState.START:
+            state = start_screen(screen, BG_PATH)
+        elif state is GameState.PLAYING:
+            state = magic(session)
+        elif state is GameState.PAUSED:
+            state = pause_screen(screen)
+        elif state is GameState.GAME_OVER:
+            session.save_score()
+            state = end_screen(screen)
+            session.restart()
+session.close()
 
-magic()
\ No newline at end of file
+if CAPTURE_PATH:
+    summary = session.capture.summary()
+    print(f"{CAPTURE_PATH}: {summary['written']} of {summary['frames']} frames written, {summary['dropped']} dropped, "
+          f"{summary['mb']:.1f} MB, main thread ms p50 {summary['main_ms'][0]:.2f} p99 {summary['main_ms'][1]:.2f}, "
+          f"CPU ms p50 {summary['main_cpu_ms'][0]:.2f} p99 {summary['main_cpu_ms'][1]:.2f}")
+if PROFILE_OUT:
+    session.profiler.dump(PROFILE_OUT)
+pygame.quit()
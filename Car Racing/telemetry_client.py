@@ -0,0 +1,193 @@
+"""
+Headless spectator of the game telemetry stream started with main.py --telemetry:
+
+    python main.py --telemetry 127.0.0.1:5555
+    python telemetry_client.py 127.0.0.1:5555
+
+Client rebuilds world state from keyframes and deltas and prints it once a second with received bytes
+and lag from capture to decoding. Loopback mode runs a headless game with the server in this process
+and measures the stream without a display:
+
+    python telemetry_client.py --loopback --seconds 10
+    python telemetry_client.py --loopback --unix
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import socket
+import sys
+import tempfile
+import threading
+import time
+from time import perf_counter
+import numpy as np
+from game_telemetry import HELLO, KEY, WorldState, parse_address, read_messages, capture
+
+
+def connect(address: str, timeout: float = 5.0):
+    """
+    :param address: "host:port", "port" or "unix:path"
+    :param timeout: seconds to wait for server
+    :return: connected blocking socket
+    """
+    family, target = parse_address(address)
+    deadline = perf_counter() + timeout
+    while True:
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.connect(target)
+            return sock
+        except OSError:
+            sock.close()
+            if perf_counter() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+class Spectator:
+    def __init__(self, address: str):
+        """
+        Reads telemetry stream into WorldState and collects statistics of the stream.
+        :param address: address of game
+        """
+        self.sock = connect(address)
+        self.state = WorldState()
+        self.messages = 0
+        self.keyframes = 0
+        self.bytes = 0
+        self.lags = []
+
+    def run(self, on_message=None):
+        """
+        Reads stream until the game closes it.
+        :param on_message: function called with spectator after every applied snapshot
+        """
+        for kind, body, size in read_messages(self.sock):
+            self.state.apply(kind, body)
+            self.bytes += size
+            if kind == KEY:
+                self.keyframes += 1
+            if kind != HELLO:
+                self.messages += 1
+                self.lags.append((time.time() - self.state.captured) * 1000)
+                if on_message is not None:
+                    on_message(self)
+        self.sock.close()
+
+
+def watch(address: str):
+    """
+    Prints state of the game once a second.
+    :param address: address of game
+    """
+    spectator = Spectator(address)
+    last = [perf_counter(), 0, 0]
+
+    def report(spectator):
+        now = perf_counter()
+        if now - last[0] < 1:
+            return
+        state = spectator.state
+        lags = spectator.lags[last[2]:]
+        print(f"frame {state.frame:6} score {state.score:8.1f} health {state.health} "
+              f"{'immortal ' if state.immortal else ''}speed {state.speed:2} enemies {len(state.enemies):2} "
+              f"coins {len(state.coins)} | {(spectator.bytes - last[1]) / (now - last[0]) / 1024:6.1f} KB/s "
+              f"lag {np.median(lags):.2f} ms")
+        last[:] = now, spectator.bytes, len(spectator.lags)
+
+    try:
+        spectator.run(report)
+    except KeyboardInterrupt:
+        pass
+
+
+def loopback(seconds: float, unix: bool, fast: bool):
+    """
+    Plays headless game with telemetry server and spectator in this process, prints stream statistics
+    and checks that spectator rebuilt the final state.
+    :param seconds: game time of measurement
+    :param unix: use Unix socket instead of TCP
+    :param fast: step simulation as fast as possible instead of FPS steps per second
+    """
+    from game_config import FPS
+    from game_engine import Simulation
+    from game_items import model_table
+    from game_telemetry import TelemetryServer
+    from batch import dodge_policy
+
+    simulation = Simulation(seed=1)
+    address = f"unix:{os.path.join(tempfile.mkdtemp(), 'telemetry.sock')}" if unix else "127.0.0.1:0"
+    server = TelemetryServer(address, model_table())
+    if not unix:
+        address = f"127.0.0.1:{server.bound[1]}"
+    spectator = Spectator(address)
+    reader = threading.Thread(target=spectator.run)
+    reader.start()
+    while server.clients == 0:
+        time.sleep(0.01)
+
+    policy = dodge_policy(1)
+    steps = int(seconds * FPS)
+    publish_times = np.empty(steps)
+    games = 1
+    start = perf_counter()
+    for i in range(steps):
+        if not simulation.step(policy(simulation)):
+            simulation.reset(1 + games)
+            games += 1
+        before = perf_counter()
+        server.publish(simulation)
+        publish_times[i] = perf_counter() - before
+        if not fast:
+            delay = start + (i + 1) / FPS - perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    elapsed = perf_counter() - start
+    # the last state may have been dropped, it is published again when sender has room for it
+    while server.queued:
+        time.sleep(0.01)
+    server.publish(simulation)
+    final = capture(simulation, server.games)
+    server.close()
+    reader.join()
+
+    state = spectator.state
+    rebuilt = ([state.game, state.frame, state.health] == [final[0][0], final[0][1], final[0][9]] and
+               sorted([entity_id, *entity] for entity_id, entity in state.enemies.items()) == sorted(final[1]) and
+               sorted([entity_id, *entity] for entity_id, entity in state.coins.items()) == sorted(final[2]))
+    lags = np.array(spectator.lags)
+    publish_times *= 1e6
+    print(f"{'unix' if unix else 'tcp'} loopback: {steps} steps, {games} games in {elapsed:.1f} s")
+    print(f"snapshots published {server.published}, dropped {server.dropped}, received {spectator.messages}, "
+          f"keyframes {spectator.keyframes}")
+    print(f"stream {spectator.bytes / elapsed / 1024:.1f} KB/s, {spectator.bytes / max(spectator.messages, 1):.0f} "
+          f"bytes per snapshot")
+    print(f"lag ms p50 {np.percentile(lags, 50):.3f} p95 {np.percentile(lags, 95):.3f} max {lags.max():.3f}")
+    print(f"publish on game loop us p50 {np.percentile(publish_times, 50):.1f} "
+          f"p99 {np.percentile(publish_times, 99):.1f}")
+    print(f"final state rebuilt: {'yes' if rebuilt else 'NO'}")
+    return rebuilt
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="headless spectator of game telemetry")
+    parser.add_argument("address", help="host:port, port or unix:path of game", nargs="?")
+    parser.add_argument("--loopback", help="measure stream of headless game in this process", action="store_true")
+    parser.add_argument("--seconds", help="game time of loopback measurement", type=float, default=10)
+    parser.add_argument("--unix", help="loopback over Unix socket", action="store_true")
+    parser.add_argument("--fast", help="loopback game runs as fast as possible", action="store_true")
+    args = parser.parse_args()
+
+    if args.loopback:
+        sys.exit(0 if loopback(args.seconds, args.unix, args.fast) else 1)
+    if not args.address:
+        parser.error("address of game is needed without --loopback")
+    watch(args.address)
+
+
+if __name__ == "__main__":
+    main()